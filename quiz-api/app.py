@@ -1,33 +1,138 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, current_app, jsonify, request, send_file, abort, stream_with_context, g
 from flask_cors import CORS
+import atexit
 import os
 import secrets
 import base64
 from datetime import datetime, timedelta
-from models import db, Question, Answer, Participation, AdminSession
-from auth import generate_token, token_required
-from validation import validate_base64_image
+from models import db, Question, Answer, Participation, AdminSession, QUESTION_FIELDS, question_load_options
+from auth import generate_token, token_required, revoke_token, revoke_all_tokens, init_token_cache
+from images import find_image, find_image_variant, store_question_image
+from validation import validate_question_data
+from grading import get_answer_key, init_answer_key
+from serialization import (FastJSONProvider, init_question_fragments, question_json_by_id,
+                           question_json_by_position, all_questions_json)
+from bundle import ENCODINGS as BUNDLE_ENCODINGS, get_quiz_bundle, init_quiz_bundles
+from ordering import shift_positions
+from bulk import import_questions, export_questions, export_participations
+from quiz_state import commit_quiz_change, quiz_etag, record_quiz_version, init_quiz_state, bump_scores_version
+from leaderboard import leaderboard, init_leaderboard
+from ranking import score_index, init_score_index
+from stats import pack_choices, layout_id, record_choices, question_stats, delete_choice_counts
+from search import index_answers, init_search, search_questions
+from batch_grading import grade_submissions, regrade_participations
+from batching import ParticipationBatcher, ParticipationPending
+from variants import VARIANTS as IMAGE_VARIANTS, init_image_processor
+from ratelimit import init_rate_limits, admission_controlled
+from instrumentation import init_query_counter
+from database import init_sqlite
+from migrations import upgrade_schema  # noqa: F401  Run by every create_all()
+from migrations import backfill_question_images
+from snapshots import SnapshotError, init_snapshots, restore_snapshot
+from metrics import Metrics, metrics, init_metrics, current_route
 from werkzeug.exceptions import HTTPException
 
-app = Flask(__name__)
-CORS(app)
+api = Blueprint('api', __name__)
 
-# Configuration
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
-app.config['ADMIN_PASSWORD'] = os.environ.get('ADMIN_PASSWORD', 'iloveflask')
-# Always store DB inside Flask instance folder to avoid cwd-dependent paths
-instance_path = app.instance_path
-os.makedirs(instance_path, exist_ok=True)
-db_path = os.path.join(instance_path, 'quiz.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['MAX_IMAGE_SIZE_BYTES'] = 1024 * 1024  # 1MB
+def create_app(config=None):
+    """Application factory: settings are read from the environment, then
+    overridden by `config` if given"""
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    CORS(app)
 
-# Initialize database
-db.init_app(app)
+    # Configuration
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
+    app.config['ADMIN_PASSWORD'] = os.environ.get('ADMIN_PASSWORD', 'iloveflask')
+    # Always store DB inside Flask instance folder to avoid cwd-dependent paths
+    instance_path = app.instance_path
+    os.makedirs(instance_path, exist_ok=True)
+    db_path = os.path.join(instance_path, 'quiz.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{db_path}')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['MAX_IMAGE_SIZE_BYTES'] = 1024 * 1024  # 1MB
+    app.config['MAX_IMPORT_SIZE_BYTES'] = int(os.environ.get('MAX_IMPORT_SIZE_BYTES', 100 * 1024 * 1024))  # 100MB
+    app.config['IMAGE_STORE_PATH'] = os.environ.get('IMAGE_STORE_PATH', os.path.join(instance_path, 'images'))
+    # Database snapshots of /snapshots with "storage": "disk" (see snapshots.py)
+    app.config['SNAPSHOT_PATH'] = os.environ.get('SNAPSHOT_PATH', os.path.join(instance_path, 'snapshots'))
+    # Thumbnail and display variants of uploaded images (needs Pillow, see variants.py)
+    app.config['IMAGE_PROCESSING'] = os.environ.get('IMAGE_PROCESSING', '1') == '1'
+    app.config['IMAGE_PROCESSING_WORKERS'] = int(os.environ.get('IMAGE_PROCESSING_WORKERS', '2'))
+    # Report the number of SQL statements of each request in X-Query-Count (debug / tests)
+    app.config['SQL_QUERY_COUNTING'] = os.environ.get('SQL_QUERY_COUNTING', '0') == '1'
+    # Request and SQL metrics served in Prometheus format on /metrics
+    app.config['METRICS'] = os.environ.get('METRICS', '1') == '1'
+
+    # SQLite connection settings (see database.py)
+    app.config['SQLITE_WAL'] = os.environ.get('SQLITE_WAL', '1') == '1'
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    # With several worker processes, how often in-memory caches re-read the
+    # quiz version, leaderboard and revoked tokens from the database (0: never)
+    app.config['CACHE_REVALIDATE_SECONDS'] = float(os.environ.get('CACHE_REVALIDATE_SECONDS', '0'))
+
+    # Async serving mode (asgi.py): read connections of the event loop, and
+    # threads running the requests handed to the synchronous app
+    app.config['ASYNC_DB_CONNECTIONS'] = int(os.environ.get('ASYNC_DB_CONNECTIONS', '4'))
+    app.config['ASYNC_WSGI_THREADS'] = int(os.environ.get('ASYNC_WSGI_THREADS', '8'))
+
+    # Optional group commit of participations (see batching.py)
+    app.config['PARTICIPATION_BATCHING'] = os.environ.get('PARTICIPATION_BATCHING', '0') == '1'
+    app.config['PARTICIPATION_BATCH_INTERVAL_MS'] = int(os.environ.get('PARTICIPATION_BATCH_INTERVAL_MS', '5'))
+    app.config['PARTICIPATION_BATCH_SIZE'] = int(os.environ.get('PARTICIPATION_BATCH_SIZE', '100'))
+
+    # Admission control of the public write endpoints (see ratelimit.py)
+    app.config['RATE_LIMITING'] = os.environ.get('RATE_LIMITING', '1') == '1'
+    app.config['RATE_LIMIT_KEY_HEADER'] = os.environ.get('RATE_LIMIT_KEY_HEADER')  # e.g. X-Forwarded-For behind a proxy
+    # Per-client limits keyed on the socket address, only right when clients connect directly
+    app.config['RATE_LIMIT_BY_IP'] = os.environ.get('RATE_LIMIT_BY_IP', '0') == '1'
+    app.config['RATE_LIMIT_TRUSTED_PROXIES'] = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '1'))  # proxies appending to it
+    app.config['PARTICIPATION_RATE_LIMIT'] = float(os.environ.get('PARTICIPATION_RATE_LIMIT', '5'))  # per second and client
+    app.config['PARTICIPATION_RATE_BURST'] = int(os.environ.get('PARTICIPATION_RATE_BURST', '20'))
+    app.config['LOGIN_RATE_LIMIT'] = float(os.environ.get('LOGIN_RATE_LIMIT', '1'))
+    app.config['LOGIN_RATE_BURST'] = int(os.environ.get('LOGIN_RATE_BURST', '10'))
+    app.config['WRITE_CONCURRENCY'] = int(os.environ.get('WRITE_CONCURRENCY', '8'))
+    app.config['WRITE_QUEUE_WAIT_MS'] = int(os.environ.get('WRITE_QUEUE_WAIT_MS', '500'))
+
+    if config:
+        app.config.update(config)
+
+    # Initialize database
+    db.init_app(app)
+    init_sqlite(app, db)
+    # Caches of this app, so that apps on different databases never share them
+    init_quiz_state(app)
+    init_answer_key(app)
+    init_question_fragments(app)
+    init_quiz_bundles(app)
+    init_token_cache(app)
+    init_search(app)
+    init_leaderboard(app)
+    init_score_index(app)
+    app.extensions['metrics'] = Metrics()
+    if app.config['SQL_QUERY_COUNTING']:
+        init_query_counter(app, db)
+    if app.config['METRICS']:
+        init_metrics(app, db)
+    init_rate_limits(app)
+    init_image_processor(app)
+    init_snapshots(app)
+
+    app.extensions['participation_batcher'] = None
+    if app.config['PARTICIPATION_BATCHING']:
+        participation_batcher = ParticipationBatcher(
+            app,
+            flush_interval=app.config['PARTICIPATION_BATCH_INTERVAL_MS'] / 1000,
+            max_batch_size=app.config['PARTICIPATION_BATCH_SIZE']
+        )
+        app.extensions['participation_batcher'] = participation_batcher
+        atexit.register(participation_batcher.stop)
+
+    app.register_blueprint(api)
+    return app
 
 # Ensure JSON errors instead of default HTML pages
-@app.errorhandler(HTTPException)
+@api.app_errorhandler(HTTPException)
 def handle_http_exception(e):
     response = jsonify({
         "error": e.description,
@@ -35,22 +140,65 @@ def handle_http_exception(e):
     })
     return response, e.code
 
-@app.errorhandler(Exception)
+@api.app_errorhandler(Exception)
 def handle_unexpected_exception(e):
+    current_app.logger.exception("Unhandled exception on %s %s", request.method, request.path)
+    metrics.exception_raised(current_route(), type(e).__name__)
     return jsonify({
         "error": "Internal server error"
     }), 500
 
 # Request size validation middleware
-@app.before_request
+@api.before_app_request
 def check_request_size():
-    """Check if request size exceeds 1MB limit"""
-    if request.content_length and request.content_length > app.config['MAX_IMAGE_SIZE_BYTES']:
+    """Check if request size exceeds 1MB limit (bulk imports have their own limit)"""
+    if request.endpoint == 'api.import_questions_ndjson':
+        if request.content_length and request.content_length > current_app.config['MAX_IMPORT_SIZE_BYTES']:
+            return jsonify({
+                "error": "Import too large."
+            }), 413
+        return None
+    if request.content_length and request.content_length > current_app.config['MAX_IMAGE_SIZE_BYTES']:
         return jsonify({
             "error": "Request too large. Maximum size allowed is 1MB."
         }), 413
 
-@app.route('/')
+def not_modified(etag):
+    """Return a 304 response if the client already holds this version, else None"""
+    if request.if_none_match.contains(etag):
+        return with_etag(current_app.response_class(status=304), etag)
+    return None
+
+def requested_image_size():
+    """Image variant asked for with ?size=, or None for the original
+    (also when images are not processed, so that URLs stay immutable)"""
+    size = request.args.get('size')
+    if size in (None, '', 'original'):
+        return None
+    if size not in IMAGE_VARIANTS:
+        abort(400, description=f"Size must be one of: original, {', '.join(IMAGE_VARIANTS)}")
+    if current_app.extensions['image_processor'] is None:
+        return None
+    return size
+
+def schedule_image_variants(image_hash):
+    """Queue the processing of a stored image, without waiting for it"""
+    image_processor = current_app.extensions['image_processor']
+    if image_processor is None or not image_hash:
+        return
+    if all(find_image_variant(image_hash, variant) for variant in IMAGE_VARIANTS):
+        return
+    image = find_image(image_hash)
+    if image is not None:
+        image_processor.submit(image_hash, image[0])
+
+def with_etag(response, etag):
+    # Clients and proxies may keep the response but must revalidate it
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@api.route('/')
 def hello_world():
     return jsonify({
         "message": "Quiz API is running!",
@@ -59,53 +207,150 @@ def hello_world():
     })
 
 # Public endpoints - Front Office
-@app.route('/quiz-info', methods=['GET'])
+@api.route('/quiz-info', methods=['GET'])
 def get_quiz_info():
     try:
-        size = Question.query.count()
-        participations = Participation.query.order_by(Participation.score.desc(), Participation.created_at.desc()).limit(10).all()
-        scores = [p.to_dict() for p in participations]
+        etag = f'{quiz_etag()}-{leaderboard.digest()}'
+        cached = not_modified(etag)
+        if cached:
+            return cached
         
-        return jsonify({
-            "size": size,
-            "scores": scores
-        })
+        # Both values are served from memory once warmed up
+        return with_etag(jsonify({
+            "size": len(get_answer_key()),
+            "scores": leaderboard.top()
+        }), etag)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/quiz-bundle', methods=['GET'])
+def get_quiz_bundle_route():
+    """The whole playable quiz in one response, without the correct answers.
+    
+    Serialized and compressed once per quiz version, then served from memory
+    in the best encoding the client accepts. ?size= picks the image variant.
+    """
+    image_size = requested_image_size()
+    try:
+        encoding = request.accept_encodings.best_match(BUNDLE_ENCODINGS, default='identity')
+        etag = f'{quiz_etag()}-{image_size}-{encoding}' if image_size else f'{quiz_etag()}-{encoding}'
+        cached = not_modified(etag)
+        if cached:
+            cached.vary.add('Accept-Encoding')
+            return cached
+        
+        bundle = get_quiz_bundle(image_size)
+        response = current_app.response_class(bundle.bodies[encoding], mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return with_etag(response, bundle.etag(encoding))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/questions/all', methods=['GET'])
+@api.route('/questions/all', methods=['GET'])
 @token_required
 def get_all_questions():
+    """All questions, or one page of them with ?limit= and ?after=<position>.
+    
+    ?fields=id,title,... restricts the returned fields; columns and answers
+    that are not requested are not read from the database.
+    """
+    fields = request.args.get('fields')
+    if fields is not None:
+        fields = [field for field in fields.split(',') if field]
+        unknown_fields = [field for field in fields if field not in QUESTION_FIELDS]
+        if unknown_fields:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown_fields)}"}), 400
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after', 0, type=int)
+    if limit is not None and not 1 <= limit <= 1000:
+        return jsonify({"error": "limit must be between 1 and 1000"}), 400
+    
     try:
-        questions = Question.query.order_by(Question.position).all()
+        if limit is None and fields is None:
+            # Concatenation of the cached per-question JSON
+            return current_app.response_class(all_questions_json(), mimetype='application/json')
+        
+        query = Question.query.options(*question_load_options(fields)).order_by(Question.position)
+        if limit is None:
+            questions = query.all()
+            return jsonify({
+                "questions": [q.to_dict(fields) for q in questions]
+            })
+        
+        # Keyset pagination on position
+        questions = query.filter(Question.position > after).limit(limit + 1).all()
+        has_more = len(questions) > limit
+        questions = questions[:limit]
         return jsonify({
-            "questions": [q.to_dict() for q in questions]
+            "questions": [q.to_dict(fields) for q in questions],
+            "nextCursor": questions[-1].position if has_more else None
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/questions/<int:question_id>', methods=['GET'])
+@api.route('/questions/<int:question_id>', methods=['GET'])
 def get_question_by_id(question_id):
+    image_size = requested_image_size()
     try:
-        question = Question.query.get(question_id)
-        if question is None:
+        etag = f'{quiz_etag()}-{image_size}' if image_size else quiz_etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        question_json = question_json_by_id(question_id, image_size)
+        if question_json is None:
             return jsonify({"error": "Question not found"}), 404
-        return jsonify(question.to_dict())
+        return with_etag(current_app.response_class(question_json, mimetype='application/json'), etag)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/questions', methods=['GET'])
+@api.route('/questions', methods=['GET'])
 def get_question_by_position():
     position = request.args.get('position', 1, type=int)
+    image_size = requested_image_size()
     try:
-        question = Question.query.filter_by(position=position).first()
-        if question is None:
+        etag = f'{quiz_etag()}-{image_size}' if image_size else quiz_etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        question_json = question_json_by_position(position, image_size)
+        if question_json is None:
             return jsonify({"error": "Question not found"}), 404
-        return jsonify(question.to_dict())
+        return with_etag(current_app.response_class(question_json, mimetype='application/json'), etag)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/participations', methods=['POST'])
+@api.route('/images/<image_hash>', methods=['GET'])
+def get_image(image_hash):
+    size = request.args.get('size')
+    if size and size != 'original':
+        if size not in IMAGE_VARIANTS:
+            abort(400, description=f"Size must be one of: original, {', '.join(IMAGE_VARIANTS)}")
+        variant = find_image_variant(image_hash, size)
+        if variant is not None:
+            path, mimetype = variant
+            response = send_file(path, mimetype=mimetype, etag=f'{image_hash}-{size}', conditional=True)
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+            return response
+    
+    # Content-addressed: a given URL always serves the same bytes
+    image = find_image(image_hash)
+    if image is None:
+        abort(404, description="Image not found")
+    path, mimetype = image
+    response = send_file(path, mimetype=mimetype, etag=image_hash, conditional=True)
+    if size and size != 'original':
+        # Variant not processed yet: the original stands in, until revalidation finds the variant
+        response.headers['Cache-Control'] = 'no-cache'
+    else:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@api.route('/participations', methods=['POST'])
+@admission_controlled('participation')
 def submit_participation():
     data = request.get_json()
     try:
@@ -115,75 +360,139 @@ def submit_participation():
         if not answers:
             return jsonify({"error": "No answers provided"}), 400
         
-        # Get all questions ordered by position
-        questions = Question.query.order_by(Question.position).all()
+        # Grade against the compiled answer key, no database read needed
+        answer_key = get_answer_key()
         
-        if len(answers) != len(questions):
+        if len(answers) != len(answer_key):
             return jsonify({"error": "Number of answers doesn't match number of questions"}), 400
         
-        score = 0
-        answers_summaries = []
+        score, answers_summaries = answer_key.grade(answers)
         
-        for i, question in enumerate(questions):
-            selected_answer_position = answers[i] if i < len(answers) else None
-            
-            # Sort answers by order field to ensure consistent ordering
-            sorted_answers = sorted(question.answers, key=lambda a: a.order)
-            correct_answer = next((a for a in sorted_answers if a.is_correct), None)
-            
-            if correct_answer:
-                # Find the position (1-based) of the correct answer in the sorted list
-                correct_answer_position = next((j+1 for j, a in enumerate(sorted_answers) if a.is_correct), 1)
-                
-                # Check if the selected position matches the correct position
-                was_correct = selected_answer_position == correct_answer_position
-                
-                if was_correct:
-                    score += 1
-                    
-                answers_summaries.append({
-                    "correctAnswerPosition": correct_answer_position,
-                    "wasCorrect": was_correct
-                })
-        
-        # Save participation
+        # Save participation, with its choices and the choice counters
+        created_at = datetime.utcnow()
+        choices = pack_choices(answers)
         participation = Participation(
             player_name=player_name,
-            score=score
+            score=score,
+            created_at=created_at,
+            choices=choices,
+            layout_id=layout_id(answer_key)
         )
-        db.session.add(participation)
-        db.session.commit()
+        participation_dict = participation.to_dict()
+
+        def record_score():
+            leaderboard.add(score, created_at, participation_dict)
+            score_index.add(score)
+
+        participation_batcher = current_app.extensions['participation_batcher']
+        if participation_batcher is not None:
+            # Group commit: returns once the batch holding this row is committed,
+            # which the writer thread records in the leaderboard and score index
+            participation_batcher.submit({
+                "player_name": player_name,
+                "score": score,
+                "created_at": created_at,
+                "choices": choices,
+                "layout_id": participation.layout_id
+            }, answer_key.question_ids, on_commit=record_score)
+        else:
+            db.session.add(participation)
+            record_choices([(answer_key.question_ids, choices)])
+            db.session.commit()
+            record_score()
+        rank, percentile, _ = score_index.rank(score)
         
         return jsonify({
             "answersSummaries": answers_summaries,
             "playerName": player_name,
-            "score": score
+            "score": score,
+            "rank": rank,
+            "percentile": percentile
         })
         
+    except ParticipationPending:
+        # Saved shortly, without its rank yet: the client must not submit it again
+        return jsonify({
+            "answersSummaries": answers_summaries,
+            "playerName": player_name,
+            "score": score,
+            "rank": None,
+            "percentile": None,
+            "pending": True
+        }), 202
+    except TimeoutError:
+        # Withdrawn from the queue, so submitting it again is safe
+        response = jsonify({"error": "Participation was not saved in time, please retry"})
+        response.headers['Retry-After'] = '1'
+        return response, 503
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@api.route('/participations/rank', methods=['GET'])
+def get_participation_rank():
+    """Global rank and percentile a score would have, without scanning the participations"""
+    score = request.args.get('score', type=int)
+    if score is None or score < 0:
+        return jsonify({"error": "score must be a non-negative integer"}), 400
+    try:
+        rank, percentile, total = score_index.rank(score)
+        return jsonify({
+            "score": score,
+            "rank": rank,
+            "percentile": percentile,
+            "participations": total
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # Auth endpoint
-@app.route('/login', methods=['POST'])
+@api.route('/login', methods=['POST'])
+@admission_controlled('login')
 def admin_login():
     data = request.get_json()
     password = data.get('password', '')
     
-    if password == app.config['ADMIN_PASSWORD']:
+    if password == current_app.config['ADMIN_PASSWORD']:
         token = generate_token()
         return jsonify({"token": token})
     else:
         return jsonify({"error": "Invalid password"}), 401
 
+@api.route('/logout', methods=['POST'])
+@token_required
+def admin_logout():
+    try:
+        revoke_token(g.token, g.token_payload)
+        return '', 204
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/sessions/all', methods=['DELETE'])
+@token_required
+def revoke_all_sessions():
+    """Log out every admin, including the caller"""
+    try:
+        revoke_all_tokens()
+        return '', 204
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
 # Rebuild database endpoint
-@app.route('/rebuild-db', methods=['POST'])
+@api.route('/rebuild-db', methods=['POST'])
 @token_required
 def rebuild_database():
     try:
-        # Drop all tables and recreate them
-        db.drop_all()
+        # Drop all tables and recreate them, except the admin sessions: their
+        # revocations must outlive the data (like with a snapshot restore)
+        kept = {AdminSession.__table__}
+        db.metadata.drop_all(db.engine, tables=[t for t in db.metadata.sorted_tables if t not in kept])
         db.create_all()
+        commit_quiz_change()
+        leaderboard.reset()
+        score_index.reset()
         
         # Don't initialize sample data - let Newman tests build their own question set
         # init_sample_data()
@@ -193,34 +502,96 @@ def rebuild_database():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def live_sqlite_connection():
+    """Pooled connection of the engine (to close after use) and its sqlite3
+    connection, None for another database"""
+    if db.engine.dialect.name != 'sqlite':
+        return None, None
+    # No transaction of this request may be left open during a backup
+    db.session.close()
+    connection = db.engine.raw_connection()
+    return connection, connection.driver_connection
+
+@api.route('/snapshots', methods=['GET'])
+@token_required
+def list_snapshots():
+    return jsonify({"snapshots": current_app.extensions['snapshots'].list()})
+
+@api.route('/snapshots/<name>', methods=['POST'])
+@token_required
+def create_snapshot(name):
+    """Copy the database into snapshot `name`, {"storage": "disk"} (default,
+    shared by every worker) or {"storage": "memory"} (this worker only)"""
+    data = request.get_json(silent=True) or {}
+    storage = data.get('storage', 'disk')
+    connection, live = live_sqlite_connection()
+    if live is None:
+        return jsonify({"error": "Snapshots need a SQLite database"}), 400
+    try:
+        current_app.extensions['snapshots'].create(name, live, storage)
+        return jsonify({"name": name, "storage": storage}), 201
+    except SnapshotError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        connection.close()
+
+@api.route('/snapshots/<name>/restore', methods=['POST'])
+@token_required
+def restore_database_snapshot(name):
+    """Replace the database with snapshot `name`, in one step: a fast
+    alternative to /rebuild-db followed by re-creating the test data"""
+    connection, live = live_sqlite_connection()
+    if live is None:
+        return jsonify({"error": "Snapshots need a SQLite database"}), 400
+    try:
+        version = restore_snapshot(current_app.extensions['snapshots'], name, live)
+    except KeyError:
+        return jsonify({"error": "Snapshot not found"}), 404
+    except SnapshotError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        connection.close()
+    # Tables (and the search index) missing from a snapshot of an older version
+    db.create_all()
+    # Every cache keyed on the quiz version follows the new version; the
+    # score caches are read again (other workers: on their next revalidation)
+    record_quiz_version(version)
+    leaderboard.reset(empty=False)
+    score_index.reset(empty=False)
+    return jsonify({"name": name, "version": version})
+
+@api.route('/snapshots/<name>', methods=['DELETE'])
+@token_required
+def delete_snapshot(name):
+    try:
+        current_app.extensions['snapshots'].delete(name)
+        return '', 204
+    except KeyError:
+        return jsonify({"error": "Snapshot not found"}), 404
+    except SnapshotError as e:
+        return jsonify({"error": str(e)}), 400
+
 # Admin endpoints (protected)
-@app.route('/questions', methods=['POST'])
+@api.route('/questions', methods=['POST'])
 @token_required
 def create_question():
     try:
         data = request.get_json()
         
-        # Validate required fields
-        required_fields = ['title', 'text', 'position', 'possibleAnswers']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"error": f"Missing required field: {field}"}), 400
-        
-        # Validate answers
+        # Validate required fields and answers
+        error_message = validate_question_data(data)
+        if error_message:
+            return jsonify({"error": error_message}), 400
         answers = data.get('possibleAnswers', [])
-        if len(answers) != 4:
-            return jsonify({"error": "Exactly 4 answers are required"}), 400
-        
-        correct_answers = [a for a in answers if a.get('isCorrect', False)]
-        if len(correct_answers) != 1:
-            return jsonify({"error": "Exactly one correct answer is required"}), 400
-        
-        # Validate image if provided
-        image = data.get('image')
-        if image:
-            is_valid, error_message = validate_base64_image(image)
-            if not is_valid:
-                return jsonify({"error": error_message}), 400
+        
+        # Validate image if provided and move it to the image store
+        image, image_hash, error_message = store_question_image(data.get('image'))
+        if error_message:
+            return jsonify({"error": error_message}), 400
         
         # Check if position is available or shift existing questions
         position = data.get('position')
@@ -230,22 +601,17 @@ def create_question():
             position = max_position + 1
         
         # Shift existing questions at or after the target position down by one
-        existing_question = Question.query.filter_by(position=position).first()
+        existing_question = db.session.query(Question.id).filter_by(position=position).first()
         if existing_question:
-            # Move in descending order to avoid unique conflicts
-            questions_to_shift = Question.query.filter(
-                Question.position >= position
-            ).order_by(Question.position.desc()).all()
-            for q in questions_to_shift:
-                q.position = q.position + 1
-                db.session.flush()
+            shift_positions(position, None, 1)
         
         # Create question
         question = Question(
             position=position,
             title=data.get('title'),
             text=data.get('text'),
-            image=data.get('image')
+            image=image,
+            image_hash=image_hash
         )
         db.session.add(question)
         db.session.flush()  # Get question ID
@@ -259,24 +625,62 @@ def create_question():
                 order=i + 1
             )
             db.session.add(answer)
+        index_answers([question.id])
         
-        db.session.commit()
+        commit_quiz_change()
+        schedule_image_variants(image_hash)
         return jsonify({"id": question.id}), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-@app.route('/questions', methods=['PUT'])
+@api.route('/questions/import', methods=['POST'])
+@token_required
+def import_questions_ndjson():
+    """Bulk import of questions, one JSON question per line (NDJSON).
+    
+    Questions are appended after the existing ones, in file order, unless
+    ?replace=true which replaces the whole quiz. The import is atomic.
+    """
+    try:
+        if request.args.get('replace', 'false').lower() == 'true':
+            Answer.query.delete()
+            Question.query.delete()
+            delete_choice_counts()
+            start_position = 1
+        else:
+            start_position = (db.session.query(db.func.max(Question.position)).scalar() or 0) + 1
+        
+        # Parsed line by line straight from the request body
+        imported, error_message = import_questions(request.stream, start_position)
+        if error_message:
+            db.session.rollback()
+            return jsonify({"error": error_message, "imported": 0}), 400
+        
+        commit_quiz_change()
+        return jsonify({"imported": imported}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/questions/export', methods=['GET'])
+@token_required
+def export_questions_ndjson():
+    """Stream every question with its answers as NDJSON, in position order"""
+    return current_app.response_class(stream_with_context(export_questions()), mimetype='application/x-ndjson')
+
+@api.route('/questions', methods=['PUT'])
 @token_required
 def update_question_without_id():
     return jsonify({"error": "Question ID is required for updates"}), 400
 
-@app.route('/questions/<int:question_id>', methods=['PUT'])
+@api.route('/questions/<int:question_id>', methods=['PUT'])
 @token_required
 def update_question(question_id):
     try:
-        question = Question.query.get(question_id)
+        question = db.session.get(Question, question_id)
         if question is None:
             return jsonify({"error": "Question not found"}), 404
             
@@ -292,13 +696,11 @@ def update_question(question_id):
                 if len(correct_answers) > 1:
                     return jsonify({"error": "At most one correct answer is allowed"}), 400
         
-        # Validate image if provided
+        # Validate image if provided and move it to the image store
         if 'image' in data:
-            image = data.get('image')
-            if image:  # Only validate if image is not None/empty
-                is_valid, error_message = validate_base64_image(image)
-                if not is_valid:
-                    return jsonify({"error": error_message}), 400
+            image, image_hash, error_message = store_question_image(data.get('image'))
+            if error_message:
+                return jsonify({"error": error_message}), 400
         
         # Handle position change
         if 'position' in data and data['position'] != question.position:
@@ -316,27 +718,10 @@ def update_question(question_id):
             
             if new_position > old_position:
                 # Moving down: shift questions between old and new position up
-                questions_to_shift = Question.query.filter(
-                    Question.position > old_position,
-                    Question.position <= new_position
-                ).order_by(Question.position).all()
-                
-                # Shift each question up by one position
-                for q in questions_to_shift:
-                    q.position = q.position - 1
-                    db.session.flush()  # Commit each change individually
-                    
+                shift_positions(old_position + 1, new_position, -1)
             else:
                 # Moving up: shift questions between new and old position down
-                questions_to_shift = Question.query.filter(
-                    Question.position >= new_position,
-                    Question.position < old_position
-                ).order_by(Question.position.desc()).all()  # Reverse order to avoid conflicts
-                
-                # Shift each question down by one position
-                for q in questions_to_shift:
-                    q.position = q.position + 1
-                    db.session.flush()  # Commit each change individually
+                shift_positions(new_position, old_position - 1, 1)
             
             # Finally, set the target question to its new position
             question.position = new_position
@@ -348,7 +733,8 @@ def update_question(question_id):
         if 'text' in data:
             question.text = data['text']
         if 'image' in data:
-            question.image = data['image']
+            question.image = image
+            question.image_hash = image_hash
         
         question.updated_at = datetime.utcnow()
         
@@ -366,67 +752,229 @@ def update_question(question_id):
                     order=i + 1
                 )
                 db.session.add(answer)
+            index_answers([question_id])
         
-        db.session.commit()
+        commit_quiz_change()
+        if 'image' in data:
+            schedule_image_variants(image_hash)
         return '', 204
         
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-@app.route('/questions/<int:question_id>', methods=['DELETE'])
+@api.route('/questions/<int:question_id>', methods=['DELETE'])
 @token_required
 def delete_question(question_id):
     try:
-        question = Question.query.get(question_id)
+        question = db.session.get(Question, question_id)
         if question is None:
             return jsonify({"error": "Question not found"}), 404
             
         position_to_delete = question.position
         
-        # Delete the question (answers will be deleted by cascade)
+        # Delete the question (answers will be deleted by cascade) and its statistics
         db.session.delete(question)
+        delete_choice_counts(question_id)
         db.session.flush()  # Ensure deletion is processed
         
-        # Shift subsequent questions up - use temporary negative positions to avoid constraint violations
+        # Shift subsequent questions up
         if position_to_delete is not None:
-            questions_to_shift = Question.query.filter(Question.position > position_to_delete).order_by(Question.position).all()
-            # First, set all positions to negative values to avoid conflicts
-            for i, q in enumerate(questions_to_shift):
-                q.position = -(i + 1)
-            db.session.flush()
-            
-            # Then set the correct positions
-            for i, q in enumerate(questions_to_shift):
-                q.position = position_to_delete + i
+            shift_positions(position_to_delete + 1, None, -1)
         
-        db.session.commit()
+        commit_quiz_change()
         return '', 204
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error deleting question {question_id}: {str(e)}")  # Debug logging
+        current_app.logger.exception("Error deleting question %s", question_id)
         return jsonify({"error": str(e)}), 500
 
-@app.route('/questions/all', methods=['DELETE'])
+@api.route('/questions/all', methods=['DELETE'])
 @token_required
 def delete_all_questions():
     try:
         Answer.query.delete()
         Question.query.delete()
-        db.session.commit()
+        delete_choice_counts()
+        commit_quiz_change()
         return '', 204
         
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-@app.route('/participations/all', methods=['DELETE'])
+@api.route('/questions/stats', methods=['GET'])
+@token_required
+def get_question_stats():
+    """Choices made on each question, from the counters kept with every
+    submission. ?sort=correctRate lists the most failed questions first."""
+    sort = request.args.get('sort', 'position')
+    if sort not in ('position', 'correctRate'):
+        return jsonify({"error": "sort must be position or correctRate"}), 400
+    try:
+        stats = question_stats()
+        if sort == 'correctRate':
+            # Questions nobody answered yet come last
+            stats.sort(key=lambda q: (q["correctRate"] is None, q["correctRate"] or 0))
+        return jsonify({"questions": stats})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/questions/search', methods=['GET'])
+@token_required
+def search_questions_route():
+    """Full-text search of the question titles, texts and answers, ?q=,
+    one page of ?limit= results from ?offset="""
+    search = request.args.get('q', '')
+    limit = request.args.get('limit', 20, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if not search.strip():
+        return jsonify({"error": "q is required"}), 400
+    if not 1 <= limit <= 100:
+        return jsonify({"error": "limit must be between 1 and 100"}), 400
+    if offset < 0:
+        return jsonify({"error": "offset must be positive"}), 400
+    if db.engine.dialect.name != 'sqlite':
+        return jsonify({"error": "Search needs a SQLite database"}), 400
+    
+    try:
+        questions, total = search_questions(search, limit, offset)
+        return jsonify({
+            "questions": questions,
+            "total": total,
+            "nextOffset": offset + limit if offset + limit < total else None
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/participations/regrade', methods=['POST'])
+@token_required
+def regrade_all_participations():
+    """Recompute every score from the stored choices against the current
+    answer key, e.g. after a wrong isCorrect flag was fixed"""
+    try:
+        result = regrade_participations(get_answer_key())
+        # Scores changed behind the leaderboard and rank caches (of every worker)
+        bump_scores_version()
+        db.session.commit()
+        leaderboard.reset(empty=False)
+        score_index.reset(empty=False)
+        return jsonify(result)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/participations/batch', methods=['POST'])
+@token_required
+def grade_participations_batch():
+    """Grade many submissions in one request, {"participations": [{"playerName",
+    "answers"}, ...]}; they are recorded unless "save" is false"""
+    data = request.get_json()
+    submissions = data.get('participations') if isinstance(data, dict) else None
+    if not isinstance(submissions, list) or not submissions:
+        return jsonify({"error": "participations must be a non-empty list"}), 400
+    try:
+        answer_key = get_answer_key()
+        for i, submission in enumerate(submissions):
+            answers = submission.get('answers') if isinstance(submission, dict) else None
+            if not isinstance(answers, list) or len(answers) != len(answer_key):
+                return jsonify({"error": f"Participation {i}: number of answers doesn't match number of questions"}), 400
+        
+        save = data.get('save', True) is not False
+        scores = grade_submissions(answer_key, submissions, save=save)
+        if save:
+            leaderboard.reset(empty=False)
+            score_index.reset(empty=False)
+        return jsonify({
+            "scores": scores,
+            "saved": len(scores) if save else 0
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/participations/batching', methods=['GET'])
+@token_required
+def get_participation_batching_stats():
+    participation_batcher = current_app.extensions['participation_batcher']
+    if participation_batcher is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **participation_batcher.stats()})
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint (metrics of this process only)"""
+    if not current_app.config['METRICS']:
+        abort(404)
+    extra_lines = []
+    participation_batcher = current_app.extensions['participation_batcher']
+    if participation_batcher is not None:
+        stats = participation_batcher.stats()
+        extra_lines = [
+            '# HELP quiz_participation_batches_total Participation batches committed.',
+            '# TYPE quiz_participation_batches_total counter',
+            f'quiz_participation_batches_total {stats["batches"]}',
+            '# HELP quiz_participation_batch_rows_total Participations inserted by the batcher.',
+            '# TYPE quiz_participation_batch_rows_total counter',
+            f'quiz_participation_batch_rows_total {stats["rows"]}',
+            '# HELP quiz_participation_batches_failed_total Participation batches rolled back.',
+            '# TYPE quiz_participation_batches_failed_total counter',
+            f'quiz_participation_batches_failed_total {stats["failedBatches"]}',
+            '# HELP quiz_participation_batch_queue_size Participations waiting for the batcher.',
+            '# TYPE quiz_participation_batch_queue_size gauge',
+            f'quiz_participation_batch_queue_size {stats["queued"]}',
+        ]
+    image_processor = current_app.extensions['image_processor']
+    if image_processor is not None:
+        stats = image_processor.stats()
+        extra_lines += [
+            '# HELP quiz_image_variants_processed_total Images whose variants were computed.',
+            '# TYPE quiz_image_variants_processed_total counter',
+            f'quiz_image_variants_processed_total {stats["processed"]}',
+            '# HELP quiz_image_variants_failed_total Images whose processing failed.',
+            '# TYPE quiz_image_variants_failed_total counter',
+            f'quiz_image_variants_failed_total {stats["failed"]}',
+            '# HELP quiz_image_variants_pending Images waiting for processing.',
+            '# TYPE quiz_image_variants_pending gauge',
+            f'quiz_image_variants_pending {stats["pending"]}',
+        ]
+    return current_app.response_class(metrics.render(extra_lines), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api.route('/participations/export', methods=['GET'])
+@token_required
+def export_participations_stream():
+    """Stream participations as NDJSON or CSV (?format=csv), optionally
+    filtered on ?since= / ?until= (ISO 8601 dates)"""
+    output_format = request.args.get('format', 'ndjson')
+    if output_format not in ('ndjson', 'csv'):
+        return jsonify({"error": "Format must be ndjson or csv"}), 400
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        since = datetime.fromisoformat(since) if since else None
+        until = datetime.fromisoformat(until) if until else None
+    except ValueError:
+        return jsonify({"error": "Dates must be in ISO 8601 format"}), 400
+    
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    response = current_app.response_class(
+        stream_with_context(export_participations(output_format, since, until)), mimetype=mimetype
+    )
+    if output_format == 'csv':
+        response.headers['Content-Disposition'] = 'attachment; filename=participations.csv'
+    return response
+
+@api.route('/participations/all', methods=['DELETE'])
 @token_required
 def delete_all_participations():
     try:
         Participation.query.delete()
+        delete_choice_counts()
+        bump_scores_version()
         db.session.commit()
+        leaderboard.reset()
+        score_index.reset()
         return '', 204
         
     except Exception as e:
@@ -447,7 +995,10 @@ def init_sample_data():
     Answer.query.delete()
     Question.query.delete()
     Participation.query.delete()
+    delete_choice_counts()
     db.session.commit()
+    leaderboard.reset()
+    score_index.reset()
     print("Cleared existing data...")
     
     # Questions with correct answer pattern [2, 2, 4, 4, 1, 2, 4, 2, 4, 1] to match Postman test expectations
@@ -544,9 +1095,10 @@ def init_sample_data():
             answer = Answer(question_id=question.id, text=answer_text, is_correct=is_correct, order=j)
             db.session.add(answer)
             print(f"  Answer {j+1}: {answer_text} (correct: {is_correct})")
+    index_answers()
     
     print("Committing to database...")
-    db.session.commit()
+    commit_quiz_change()
     correct_pattern = [q["correct"] for q in questions_data]
     question_count = Question.query.count()
     print(f"Sample data initialized with {question_count} questions using correct pattern: {correct_pattern}")
@@ -555,9 +1107,15 @@ def init_database():
     """Initialize database with sample data"""
     with app.app_context():
         db.create_all()
+        backfill_question_images()
         # Don't initialize sample data - let the tests handle it
         # init_sample_data()
+        # Read once here, so gunicorn workers inherit it instead of each scanning the scores
+        score_index.seed()
+
+app = create_app()
 
 if __name__ == "__main__":
+    # Development server only, production runs gunicorn (see gunicorn.conf.py)
     init_database()
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(debug=os.environ.get('FLASK_DEBUG', '1') == '1', host='0.0.0.0', port=5000)
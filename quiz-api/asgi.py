@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import aiosqlite
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from werkzeug.http import parse_etags
+
+from models import db, Question, Answer, Participation
+from grading import AnswerKey, peek_answer_key, publish_answer_key
+from leaderboard import leaderboard
+from quiz_state import peek_quiz_version, record_quiz_version
+from serialization import add_question_json, dumps_bytes, peek_question_json
+from variants import VARIANTS as IMAGE_VARIANTS
+
+QUESTION_PATH = re.compile(r'/questions/(\d+)')
+
+VERSION_QUERY = 'SELECT version FROM quiz_state WHERE id = 1'
+# Same order as compile_answer_key(): questions by position, answers by order
+ANSWER_KEY_QUERY = (
+    'SELECT question.id, answer.is_correct FROM question '
+    'LEFT JOIN answer ON answer.question_id = question.id '
+    'ORDER BY question.position, question.id, answer."order", answer.id'
+)
+LEADERBOARD_QUERY = (
+    'SELECT player_name, score, created_at FROM participation '
+    'ORDER BY score DESC, created_at DESC LIMIT ?'
+)
+QUESTION_COLUMNS = 'id, position, title, text, image, image_hash'
+ANSWERS_QUERY = (
+    'SELECT id, text, is_correct, "order" FROM answer WHERE question_id = ({}) '
+    'ORDER BY "order", id'
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    """asgiref runs every WSGI call in one shared thread; Flask requests are
+    independent, so they run in a pool of threads instead"""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.run_wsgi_app = sync_to_async(
+            WsgiToAsgiInstance.run_wsgi_app.__wrapped__.__get__(self),
+            thread_sensitive=False, executor=executor
+        )
+
+
+class AsyncReadApp:
+    """ASGI entry point serving the public read endpoints on an event loop.
+
+    GET /quiz-info, /questions?position= and /questions/<id> are answered
+    from the in-memory caches shared with the Flask app (quiz version,
+    answer key, leaderboard, serialized questions). On a miss they are read
+    through a few aiosqlite connections, in one read transaction so that
+    the body and its ETag belong to the same quiz version, and concurrent
+    misses on the same key share one read. A waiting request holds a
+    coroutine instead of a thread.
+
+    Every other request (admin endpoints, submissions, images, invalid
+    parameters) goes to the synchronous Flask app, in a thread pool.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self._wsgi_executor = ThreadPoolExecutor(
+            max_workers=flask_app.config['ASYNC_WSGI_THREADS'], thread_name_prefix='wsgi'
+        )
+        with flask_app.app_context():
+            url = db.engine.url
+        # Relative paths are already resolved against the instance folder
+        self.database_path = url.database if url.get_backend_name() == 'sqlite' else None
+        if self.database_path in ('', ':memory:'):
+            self.database_path = None  # Private to the engine's own connections
+        self._pool = None  # asyncio.Queue of read-only connections
+        self._pool_lock = None
+        self._loading = {}  # key -> Future of a database read in progress
+        self._quiz_info = (None, None)  # (etag, body) of the last served /quiz-info
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] == 'http' and scope['method'] == 'GET' and self.database_path:
+            handler = self._route(scope)
+            if handler is not None:
+                await self._serve(scope, send, *handler)
+                return
+        # Rejects the scope types other than http
+        await _ThreadPoolWsgiInstance(self.flask_app, self._wsgi_executor)(scope, receive, send)
+
+    def _route(self, scope):
+        """(route, coroutine function, arguments) of a natively served request, or None"""
+        path = scope['path']
+        args = parse_qs(scope['query_string'].decode('latin-1'), keep_blank_values=True)
+        if path == '/quiz-info':
+            return '/quiz-info', self._quiz_info_response, ()
+        if path == '/questions':
+            position = args.get('position', ['1'])[0]
+            try:
+                position = int(position)
+            except ValueError:
+                position = 1  # Like request.args.get('position', 1, type=int)
+            image_size = self._image_size(args)
+            if image_size is False:
+                return None
+            return '/questions', self._question_response, (None, position, image_size)
+        match = QUESTION_PATH.fullmatch(path)
+        if match:
+            image_size = self._image_size(args)
+            if image_size is False:
+                return None
+            return '/questions/<int:question_id>', self._question_response, (int(match.group(1)), None, image_size)
+        return None
+
+    def _image_size(self, args):
+        """Like requested_image_size(), False for an invalid size (answered by Flask)"""
+        size = args.get('size', [None])[0]
+        if size in (None, '', 'original'):
+            return None
+        if size not in IMAGE_VARIANTS:
+            return False
+        if self.flask_app.extensions['image_processor'] is None:
+            return None
+        return size
+
+    async def _serve(self, scope, send, route, handler, args):
+        headers = dict(scope['headers'])
+        metrics = self.flask_app.extensions['metrics']
+        start = time.perf_counter()
+        if self.flask_app.config['METRICS']:
+            metrics.request_started(route)
+        try:
+            with self.flask_app.app_context():
+                response = await handler(*args)
+        except Exception as e:
+            logger.exception("Unhandled exception on GET %s", scope['path'])
+            metrics.exception_raised(route, type(e).__name__)
+            response = (500, None, self._json({"error": "Internal server error"}))
+
+        status, etag, body = response
+        if etag is not None and parse_etags(headers.get(b'if-none-match', b'').decode('latin-1')).contains(etag):
+            status, body = 304, b''
+        response_headers = []
+        if status != 304:
+            response_headers += [(b'content-type', b'application/json'),
+                                 (b'content-length', str(len(body)).encode())]
+        if etag is not None:
+            # Like with_etag(): clients may keep the response but must revalidate it
+            response_headers += [(b'etag', f'"{etag}"'.encode()), (b'cache-control', b'no-cache')]
+        # Like flask-cors with its default settings
+        origin = headers.get(b'origin')
+        if origin is not None:
+            response_headers += [(b'access-control-allow-origin', origin), (b'vary', b'Origin')]
+        else:
+            response_headers.append((b'access-control-allow-origin', b'*'))
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+            await send({'type': 'http.response.body', 'body': body})
+        finally:
+            if self.flask_app.config['METRICS']:
+                metrics.request_finished(route, 'GET', status, time.perf_counter() - start)
+
+    def _json(self, obj):
+        """Body of jsonify(obj)"""
+        return self.flask_app.json.response(obj).get_data()
+
+    async def _quiz_info_response(self):
+        version = peek_quiz_version()
+        answer_key = peek_answer_key(version) if version is not None else None
+        top = leaderboard.peek()
+        if answer_key is None or top is None:
+            version, answer_key, top = await self._single_flight('quiz-info', self._load_quiz_info)
+        scores, digest = top
+        etag = f'quiz-{version}-{digest}'
+        cached_etag, body = self._quiz_info
+        if cached_etag != etag:
+            body = self._json({"size": len(answer_key), "scores": scores})
+            self._quiz_info = (etag, body)
+        return 200, etag, body
+
+    async def _load_quiz_info(self):
+        changes = leaderboard.changes
+        version, key_rows, leaderboard_rows = await self._read(
+            (ANSWER_KEY_QUERY, ()), (LEADERBOARD_QUERY, (leaderboard.size,))
+        )
+        correct_positions = []
+        question_ids = []
+        for question_id, is_correct in key_rows:
+            if not question_ids or question_id != question_ids[-1]:
+                question_ids.append(question_id)
+                correct_positions.append(0)
+                index = 0
+            if is_correct is None:
+                continue  # Question without answers
+            index += 1
+            if is_correct and not correct_positions[-1]:
+                correct_positions[-1] = index
+        record_quiz_version(version)
+        answer_key = AnswerKey(correct_positions, version, question_ids)
+        publish_answer_key(answer_key)
+        participations = [
+            Participation(player_name=player_name, score=score, created_at=_parse_datetime(created_at))
+            for player_name, score, created_at in leaderboard_rows
+        ]
+        return version, answer_key, leaderboard.load(participations, changes)
+
+    async def _question_response(self, question_id, position, image_size):
+        version = peek_quiz_version()
+        body = None
+        if version is not None:
+            body = peek_question_json(version, question_id, position, image_size)
+        if body is None:
+            version, body = await self._single_flight(
+                ('question', question_id, position, image_size),
+                lambda: self._load_question(question_id, position, image_size)
+            )
+            if body is None:
+                return 404, None, self._json({"error": "Question not found"})
+        etag = f'quiz-{version}-{image_size}' if image_size else f'quiz-{version}'
+        return 200, etag, body
+
+    async def _load_question(self, question_id, position, image_size):
+        where = ('id = ?', question_id) if question_id is not None else ('position = ?', position)
+        version, question_rows, answer_rows = await self._read(
+            (f'SELECT {QUESTION_COLUMNS} FROM question WHERE {where[0]}', (where[1],)),
+            (ANSWERS_QUERY.format(f'SELECT id FROM question WHERE {where[0]}'), (where[1],))
+        )
+        if not question_rows:
+            return version, None
+        question_id, position, title, text, image, image_hash = question_rows[0]
+        question = Question(id=question_id, position=position, title=title, text=text,
+                            image=image, image_hash=image_hash)
+        question.answers = [
+            Answer(id=answer_id, text=answer_text, is_correct=bool(is_correct), order=order)
+            for answer_id, answer_text, is_correct, order in answer_rows
+        ]
+        if record_quiz_version(version) == version:
+            return version, add_question_json(version, question, image_size)
+        # The quiz changed since this read: serve it, but do not cache it
+        return version, dumps_bytes(question.to_dict(image_size=image_size))
+
+    async def _single_flight(self, key, load):
+        """Await load(), sharing one call between concurrent misses on the same key"""
+        future = self._loading.get(key)
+        if future is None:
+            future = self._loading[key] = asyncio.ensure_future(load())
+            future.add_done_callback(lambda _: self._loading.pop(key, None))
+        # A client going away must not cancel a read other requests wait for
+        return await asyncio.shield(future)
+
+    async def _read(self, *queries):
+        """Quiz version followed by the rows of each (sql, parameters), read in one transaction"""
+        pool = await self._get_pool()
+        connection = await pool.get()
+        try:
+            await connection.execute('BEGIN')
+            try:
+                async with connection.execute(VERSION_QUERY) as cursor:
+                    row = await cursor.fetchone()
+                results = [(row[0] if row else 0) or 0]
+                for sql, parameters in queries:
+                    async with connection.execute(sql, parameters) as cursor:
+                        results.append(await cursor.fetchall())
+            finally:
+                await connection.execute('COMMIT')
+        finally:
+            pool.put_nowait(connection)
+        return results
+
+    async def _get_pool(self):
+        # Opened in the event loop of the worker serving requests
+        if self._pool is None:
+            if self._pool_lock is None:
+                self._pool_lock = asyncio.Lock()
+            async with self._pool_lock:
+                if self._pool is None:
+                    pool = asyncio.Queue()
+                    timeout = self.flask_app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000
+                    for _ in range(self.flask_app.config['ASYNC_DB_CONNECTIONS']):
+                        # Autocommit mode, transactions are explicit
+                        connection = await aiosqlite.connect(self.database_path, timeout=timeout,
+                                                             isolation_level=None)
+                        await connection.execute('PRAGMA query_only = 1')
+                        pool.put_nowait(connection)
+                    self._pool = pool
+        return self._pool
+
+    async def close(self):
+        """Close the database connections and wait for the Flask requests"""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            while not pool.empty():
+                await pool.get_nowait().close()
+        self._wsgi_executor.shutdown(wait=True)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def _parse_datetime(value):
+    # SQLAlchemy stores SQLite datetimes as ISO 8601 text
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def create_asgi_app():
+    from app import app as flask_app
+    return AsyncReadApp(flask_app)
+
+
+app = create_asgi_app()
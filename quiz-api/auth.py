@@ -1,28 +1,142 @@
+import calendar
+import hashlib
+import secrets
+import threading
+import time
 import jwt
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, g
+from models import db, AdminSession
+from quiz_state import revalidation_due
+
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TTL = 300  # seconds
+
+class TokenCache:
+    """Tokens of an app already checked by this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Verified tokens: digest -> (payload, valid until as a timestamp), least recently used first
+        self.verified = OrderedDict()
+        # Revoked tokens: digest -> expiry timestamp, loaded from AdminSession on first use
+        # (and reloaded every CACHE_REVALIDATE_SECONDS to see logouts made in other workers)
+        self.revoked = None
+        self.revoked_loaded_at = 0.0
+
+def init_token_cache(app):
+    app.extensions['token_cache'] = TokenCache()
+
+def _cache():
+    return current_app.extensions['token_cache']
+
+def token_digest(token):
+    """Key under which a token is cached and stored in AdminSession"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _timestamp(utc_datetime):
+    return calendar.timegm(utc_datetime.utctimetuple())
 
 def generate_token(user_id="admin"):
-    """Generate JWT token"""
+    """Generate JWT token and record its session"""
+    expires_at = datetime.utcnow() + timedelta(hours=24)
     payload = {
         'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(hours=24),
-        'iat': datetime.utcnow()
+        'exp': expires_at,
+        'iat': datetime.utcnow(),
+        'jti': secrets.token_hex(8)  # Two logins in the same second get distinct tokens
     }
     token = jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
+    db.session.add(AdminSession(token=token_digest(token), expires_at=expires_at))
+    # Expired sessions are useless, revoked or not: jwt.decode rejects their tokens
+    AdminSession.query.filter(AdminSession.expires_at <= datetime.utcnow()).delete(synchronize_session=False)
+    db.session.commit()
     return token
 
+def _get_revoked_tokens():
+    cache = _cache()
+    revoked_tokens = cache.revoked
+    stale = revalidation_due(cache.revoked_loaded_at)
+    if revoked_tokens is None or stale:
+        sessions = AdminSession.query.filter(
+            AdminSession.revoked.is_(True),
+            AdminSession.expires_at > datetime.utcnow()
+        ).all()
+        revoked_tokens = {s.token: _timestamp(s.expires_at) for s in sessions}
+        with cache.lock:
+            if cache.revoked is None or stale:
+                cache.revoked = revoked_tokens
+                cache.revoked_loaded_at = time.monotonic()
+            revoked_tokens = cache.revoked
+    return revoked_tokens
+
 def verify_token(token):
-    """Verify JWT token"""
+    """Verify JWT token, without re-checking the signature of recently verified tokens"""
+    digest = token_digest(token)
+    if digest in _get_revoked_tokens():
+        return None
+
+    cache = _cache()
+    now = time.time()
+    with cache.lock:
+        cached = cache.verified.get(digest)
+        if cached is not None:
+            payload, valid_until = cached
+            if valid_until > now:
+                cache.verified.move_to_end(digest)
+                return payload
+            del cache.verified[digest]
+
     try:
         payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
+    # Never cache a token beyond its own expiry
+    valid_until = min(payload['exp'], now + TOKEN_CACHE_TTL) if 'exp' in payload else now + TOKEN_CACHE_TTL
+    with cache.lock:
+        cache.verified[digest] = (payload, valid_until)
+        if len(cache.verified) > TOKEN_CACHE_SIZE:
+            cache.verified.popitem(last=False)
+    return payload
+
+def _forget_revoked(digests_with_expiry):
+    cache = _cache()
+    now = time.time()
+    revoked_tokens = dict(_get_revoked_tokens())
+    revoked_tokens.update(digests_with_expiry)
+    with cache.lock:
+        # Expired tokens are rejected by jwt.decode anyway
+        cache.revoked = {d: exp for d, exp in revoked_tokens.items() if exp > now}
+        for digest in digests_with_expiry:
+            cache.verified.pop(digest, None)
+
+def revoke_token(token, payload):
+    """Revoke a token server-side (logout)"""
+    digest = token_digest(token)
+    expires_at = datetime.utcfromtimestamp(payload['exp'])
+    session = AdminSession.query.filter_by(token=digest).first()
+    if session is None:
+        session = AdminSession(token=digest, expires_at=expires_at)
+        db.session.add(session)
+    session.revoked = True
+    db.session.commit()
+    _forget_revoked({digest: _timestamp(expires_at)})
+
+def revoke_all_tokens():
+    """Revoke every recorded, unexpired admin session"""
+    sessions = AdminSession.query.filter(AdminSession.expires_at > datetime.utcnow()).all()
+    revoked = {s.token: _timestamp(s.expires_at) for s in sessions}
+    for session in sessions:
+        session.revoked = True
+    db.session.commit()
+    _forget_revoked(revoked)
+    return len(revoked)
+
 def token_required(f):
     """Decorator to require valid JWT token"""
     @wraps(f)
@@ -44,6 +158,8 @@ def token_required(f):
         if payload is None:
             return jsonify({'error': 'Token is invalid or expired'}), 401
         
+        g.token = token
+        g.token_payload = payload
         return f(*args, **kwargs)
     
     return decorated
@@ -0,0 +1,160 @@
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import bindparam, insert, select, update
+from models import db, Participation, QuizLayout
+from stats import layout_id, layout_question_ids, pack_choices, record_choice_counts
+
+try:
+    import numpy as np
+except ImportError:  # Optional, the same grading runs row by row in Python instead
+    np = None
+
+# Participations read, graded and updated per transaction
+CHUNK_SIZE = 10000
+
+# Core executemany: the ORM bulk UPDATE by primary key costs twice as much per row
+_participation_table = Participation.__table__
+UPDATE_SCORE = update(_participation_table).where(
+    _participation_table.c.id == bindparam('participation_id')
+).values(score=bindparam('new_score'))
+
+
+def choices_matrix(rows, width):
+    """Packed choices rows (bytes of `width` positions) as a participations x
+    questions matrix: a uint8 array with NumPy, else the list of rows"""
+    if np is None:
+        return list(rows)
+    return np.frombuffer(b''.join(rows), dtype=np.uint8).reshape(len(rows), width)
+
+
+def score_matrix(matrix, correct_positions):
+    """Score of each row: the questions whose chosen position is the correct
+    one, questions without a correct answer never scoring (like AnswerKey.grade)"""
+    if np is None:
+        key = list(correct_positions)
+        return [sum(1 for choice, correct in zip(row, key) if correct and choice == correct) for row in matrix]
+    key = np.asarray(correct_positions, dtype=np.uint16)
+    return ((matrix == key) & (key != 0)).sum(axis=1)
+
+
+def count_matrix_choices(question_ids, matrix):
+    """{(question id, position): count} of the choices in a matrix"""
+    if np is None:
+        counts = Counter()
+        for row in matrix:
+            counts.update(zip(question_ids, row))
+        return counts
+    width = len(question_ids)
+    # One bincount over (question index, position) pairs
+    cells = (matrix.astype(np.int64) + np.arange(width, dtype=np.int64) * 256).ravel()
+    totals = np.bincount(cells, minlength=width * 256)
+    return {
+        (question_ids[cell // 256], cell % 256): int(totals[cell])
+        for cell in np.flatnonzero(totals).tolist()
+    }
+
+
+def pack_answers(answer_lists, width):
+    """Submitted answer lists (all of `width` answers) as a choices matrix,
+    with the positions pack_choices() would store"""
+    if np is not None and answer_lists:
+        try:
+            answers = np.asarray(answer_lists)
+        except ValueError:
+            answers = None
+        # Anything but plain integers goes through pack_choices()
+        if answers is not None and answers.dtype.kind == 'i' and answers.shape == (len(answer_lists), width):
+            valid = (answers > 0) & (answers < 256)
+            return np.where(valid, answers, 0).astype(np.uint8)
+    return choices_matrix([pack_choices(answers) for answers in answer_lists], width)
+
+
+def matrix_rows(matrix):
+    """Packed choices bytes of each row of a matrix"""
+    if np is None:
+        return list(matrix)
+    return [row.tobytes() for row in matrix]
+
+
+def regrade_participations(answer_key, chunk_size=CHUNK_SIZE):
+    """Recompute every participation score from its stored choices.
+
+    Participations are read in chunks of `chunk_size` by id, grouped by
+    question layout and scored with one vectorized comparison per group
+    against the current correct answers (a question no longer in the quiz
+    does not score). Changed scores are written back with one executemany
+    UPDATE per chunk, each chunk in its own transaction so that submissions are
+    not blocked for the whole regrade; running it again is harmless.
+
+    Returns {"participations", "updated", "skipped"}; participations
+    recorded without their choices cannot be regraded and are skipped.
+    """
+    correct_by_question = dict(zip(answer_key.question_ids, answer_key.correct_positions))
+    keys = {}  # layout id -> correct positions in that layout's question order
+    for layout in QuizLayout.query.all():
+        keys[layout.id] = [correct_by_question.get(question_id, 0) for question_id in layout_question_ids(layout)]
+
+    result = {"participations": 0, "updated": 0, "skipped": 0}
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Participation.id, Participation.score, Participation.choices, Participation.layout_id)
+            .where(Participation.id > last_id).order_by(Participation.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return result
+        last_id = rows[-1].id
+        result["participations"] += len(rows)
+
+        groups = {}
+        for row in rows:
+            key = keys.get(row.layout_id)
+            if key is None or row.choices is None or len(row.choices) != len(key):
+                result["skipped"] += 1
+            else:
+                groups.setdefault(row.layout_id, []).append(row)
+
+        changes = []
+        for group_layout_id, group in groups.items():
+            key = keys[group_layout_id]
+            scores = score_matrix(choices_matrix([row.choices for row in group], len(key)), key)
+            if np is not None:
+                previous = np.fromiter((row.score for row in group), dtype=np.int64, count=len(group))
+                changed = np.flatnonzero(scores != previous).tolist()
+            else:
+                changed = [i for i, (row, score) in enumerate(zip(group, scores)) if score != row.score]
+            changes += [{"participation_id": group[i].id, "new_score": int(scores[i])} for i in changed]
+
+        if changes:
+            db.session.execute(UPDATE_SCORE, changes)
+            result["updated"] += len(changes)
+        db.session.commit()
+
+
+def grade_submissions(answer_key, submissions, save=True):
+    """Grade many {"playerName", "answers"} submissions at once.
+
+    Every submission must have one answer per question (checked by the
+    caller). Scores come from one vectorized comparison; with `save`, the
+    participations and their choice counters are inserted in one transaction.
+    Returns the scores, in submission order.
+    """
+    width = len(answer_key)
+    matrix = pack_answers([submission["answers"] for submission in submissions], width)
+    scores = [int(score) for score in score_matrix(matrix, answer_key.correct_positions)]
+    if save:
+        created_at = datetime.utcnow()
+        submission_layout_id = layout_id(answer_key)
+        db.session.execute(insert(Participation), [
+            {
+                "player_name": submission.get("playerName", "Anonymous"),
+                "score": score,
+                "created_at": created_at,
+                "choices": choices,
+                "layout_id": submission_layout_id
+            }
+            for submission, score, choices in zip(submissions, scores, matrix_rows(matrix))
+        ])
+        record_choice_counts(count_matrix_choices(answer_key.question_ids, matrix))
+        db.session.commit()
+    return scores
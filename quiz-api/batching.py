@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from sqlalchemy import insert
+from models import db, Participation
+from stats import record_choices
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+
+class ParticipationPending(Exception):
+    """The participation is in the batch being written: it will be saved
+    (or fail) after the request has stopped waiting for it"""
+
+
+class PendingParticipation:
+    __slots__ = ('row', 'question_ids', 'on_commit', 'done', 'error')
+
+    def __init__(self, row, question_ids, on_commit):
+        self.row = row
+        self.question_ids = question_ids
+        self.on_commit = on_commit
+        self.done = threading.Event()
+        self.error = None
+
+
+class ParticipationBatcher:
+    """Write-behind group commit for participation inserts.
+
+    Request threads queue their row and wait; a single writer thread inserts
+    everything queued within `flush_interval` seconds (or `max_batch_size`
+    rows) in one transaction, then wakes the waiting requests once it is
+    committed. SQLite then pays one fsync per batch instead of one per player.
+    """
+
+    def __init__(self, app, flush_interval=0.005, max_batch_size=100, wait_timeout=10.0):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.wait_timeout = wait_timeout
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        # Metrics
+        self.batches = 0
+        self.rows = 0
+        self.failed_batches = 0
+        self.max_batch_size_seen = 0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def submit(self, row, question_ids=(), on_commit=None):
+        """Queue a participation row and block until its batch is committed.
+
+        `question_ids` are the questions of row["choices"], counted in the
+        choice statistics of the same transaction. `on_commit` is called by
+        the writer thread (in an app context) once the row is committed,
+        even if the request gave up waiting.
+
+        After `wait_timeout` seconds, a row still queued is withdrawn and
+        TimeoutError is raised (it is not saved); a row already being written
+        raises ParticipationPending.
+        """
+        pending = PendingParticipation(row, question_ids, on_commit)
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("Participation batcher is stopped")
+            self._start()
+            self._queue.append(pending)
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch_size:
+                self._condition.notify()
+        if not pending.done.wait(self.wait_timeout):
+            with self._condition:
+                try:
+                    self._queue.remove(pending)
+                except ValueError:
+                    pass  # Taken by the writer meanwhile
+                else:
+                    raise TimeoutError("Participation was not saved in time")
+            raise ParticipationPending("Participation is being saved")
+        if pending.error is not None:
+            raise pending.error
+
+    def _start(self):
+        # Started lazily so each worker process gets its own writer thread
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='participation-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._stopping:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                # Give other requests a chance to join this batch
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._queue) < self.max_batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch_size))]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        error = None
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(Participation), [pending.row for pending in batch])
+                record_choices([(pending.question_ids, pending.row.get("choices", b"")) for pending in batch])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                error = e
+            if error is None:
+                for pending in batch:
+                    if pending.on_commit is not None:
+                        try:
+                            pending.on_commit()
+                        except Exception:
+                            logger.exception("Participation committed but not recorded in memory")
+        self._record(len(batch), error is not None)
+        for pending in batch:
+            pending.error = error
+            pending.done.set()
+
+    def _record(self, size, failed):
+        self.batches += 1
+        self.rows += size
+        self.max_batch_size_seen = max(self.max_batch_size_seen, size)
+        self.batch_size_counts[bisect_left(BATCH_SIZE_BUCKETS, size)] += 1
+        if failed:
+            self.failed_batches += 1
+
+    def stats(self):
+        buckets = {str(bound): count for bound, count in zip(BATCH_SIZE_BUCKETS, self.batch_size_counts)}
+        buckets['+Inf'] = self.batch_size_counts[-1]
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "failedBatches": self.failed_batches,
+            "averageBatchSize": self.rows / self.batches if self.batches else 0,
+            "maxBatchSize": self.max_batch_size_seen,
+            "batchSizes": buckets,
+            "queued": len(self._queue)
+        }
+
+    def stop(self):
+        """Flush what is queued and stop the writer thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Benchmark de charge reproductible de l'API, entièrement hors ligne
+
+Pour chaque taille de quiz (10, 1 000 et 10 000 questions par défaut, avec un
+classement de 1 000 000 de participations), rejoue quatre scénarios :
+- player_session : /quiz-info, /quiz-bundle, quelques questions par position
+  puis soumission des réponses
+- leaderboard_polling : GET /quiz-info en boucle
+- bulk_submissions : POST /participations en parallèle
+- admin_reorder : déplacements de questions (PUT /questions/<id>)
+
+contre deux cibles : le client de test Flask (coût de l'application seule) et
+un vrai serveur WSGI local en HTTP (coût de bout en bout). Le résultat est un
+document JSON (débit, latences p50/p95/p99) à comparer entre deux commits.
+Le client tourne dans le même processus que le serveur : les valeurs absolues
+servent à comparer des commits sur une même machine, pas à dimensionner.
+
+Usage: python benchmarks/load_benchmark.py [--sizes 10 1000 10000]
+       [--participations 1000000] [--targets test-client wsgi]
+       [--iterations 500] [--concurrency 8] [--output resultats.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault('IMAGE_STORE_PATH', tempfile.mkdtemp())
+os.environ['RATE_LIMITING'] = '0'  # The benchmark is a single client hammering the API
+os.environ['SQL_QUERY_COUNTING'] = '0'
+
+from sqlalchemy import insert  # noqa: E402
+from werkzeug.serving import WSGIRequestHandler, make_server  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Question, Answer, Participation  # noqa: E402
+from quiz_state import commit_quiz_change  # noqa: E402
+from leaderboard import leaderboard  # noqa: E402
+from ranking import score_index  # noqa: E402
+
+SCENARIOS = ('leaderboard_polling', 'player_session', 'bulk_submissions', 'admin_reorder')
+SEED_CHUNK_SIZE = 50000
+
+
+def seed(size, participations, rng):
+    """Recreate the database with a quiz of `size` questions and `participations` scores"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(insert(Question), [
+            {"position": i, "title": f"Question {i}", "text": "Quelle est la réponse à cette question ?"}
+            for i in range(1, size + 1)
+        ])
+        ids = [row.id for row in db.session.query(Question.id).order_by(Question.position)]
+        db.session.execute(insert(Answer), [
+            {"question_id": question_id, "text": f"Réponse {j}", "is_correct": j == 1, "order": j}
+            for question_id in ids for j in range(1, 5)
+        ])
+        start = datetime(2024, 1, 1)
+        for offset in range(0, participations, SEED_CHUNK_SIZE):
+            db.session.execute(insert(Participation), [
+                {"player_name": f"Joueur {i}", "score": rng.randint(0, size),
+                 "created_at": start + timedelta(seconds=i)}
+                for i in range(offset, min(offset + SEED_CHUNK_SIZE, participations))
+            ])
+        # Bumps the quiz version, so every cache built for a previous size is dropped
+        commit_quiz_change()
+        leaderboard.reset(empty=False)
+        score_index.reset(empty=False)
+        return ids
+
+
+class TestClientTarget:
+    """Requests through the Flask test client: application cost only"""
+
+    name = 'test-client'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = app.test_client()
+        response = client.open(path, method=method, json=body, headers=headers or {})
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like a real client behind a proxy
+    disable_nagle_algorithm = True  # Headers and body are written separately
+
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+class WSGIServerTarget:
+    """Requests over HTTP to a threaded WSGI server on localhost"""
+
+    name = 'wsgi'
+
+    def __init__(self):
+        self._server = make_server('127.0.0.1', 0, app, threaded=True,
+                                   request_handler=QuietRequestHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(
+                '127.0.0.1', self._server.server_port, timeout=60)
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        connection.request(method, path, body=payload, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        if response.will_close:
+            connection.close()  # Reopened transparently by the next request
+        return response.status, data
+
+    def close(self):
+        self._server.shutdown()
+        self._thread.join()
+
+
+class Scenario:
+    """One operation of a scenario, possibly made of several requests"""
+
+    def __init__(self, target, ids, rng, token, session_questions):
+        self.target = target
+        self.ids = ids
+        self.rng = rng
+        self.auth = {'Authorization': f'Bearer {token}'}
+        self.session_questions = session_questions
+        self.requests = 0
+
+    def call(self, method, path, body=None, headers=None, expected=(200,)):
+        status, data = self.target.request(method, path, body, headers)
+        self.requests += 1
+        if status not in expected:
+            raise RuntimeError(f"{method} {path} -> {status}: {data[:200]!r}")
+        return data
+
+    def answers(self):
+        return [self.rng.randint(1, 4) for _ in self.ids]
+
+    def leaderboard_polling(self):
+        self.call('GET', '/quiz-info')
+
+    def player_session(self):
+        self.call('GET', '/quiz-info')
+        self.call('GET', '/quiz-bundle', headers={'Accept-Encoding': 'gzip'})
+        for position in range(1, min(self.session_questions, len(self.ids)) + 1):
+            self.call('GET', f'/questions?position={position}')
+        self.call('POST', '/participations', {"playerName": "Benchmark", "answers": self.answers()})
+
+    def bulk_submissions(self):
+        self.call('POST', '/participations', {"playerName": "Benchmark", "answers": self.answers()})
+
+    def admin_reorder(self):
+        question_id = self.rng.choice(self.ids)
+        position = self.rng.randint(1, len(self.ids))
+        self.call('PUT', f'/questions/{question_id}', {"position": position}, headers=self.auth,
+                  expected=(200, 204))
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(target, name, ids, token, args, seed_value):
+    """Run `args.iterations` operations of a scenario, returns its statistics"""
+    # Admin edits are serialized by design, players come in parallel
+    concurrency = 1 if name == 'admin_reorder' else args.concurrency
+    counter = iter(range(args.iterations))
+    counter_lock = threading.Lock()
+    latencies = []
+    scenarios = []
+    errors = []
+    # Warm-up is excluded from the measured time: every thread starts together after it
+    started = []
+    barrier = threading.Barrier(concurrency, action=lambda: started.append(time.perf_counter()))
+
+    def worker(worker_index):
+        scenario = Scenario(target, ids, random.Random(seed_value + worker_index), token, args.session_questions)
+        scenarios.append(scenario)
+        operation = getattr(scenario, name)
+        for _ in range(args.warmup):
+            operation()
+        scenario.requests = 0
+        barrier.wait()
+        while True:
+            with counter_lock:
+                if next(counter, None) is None:
+                    return
+            start = time.perf_counter()
+            try:
+                operation()
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started[0]
+
+    latencies.sort()
+    requests = sum(scenario.requests for scenario in scenarios)
+    return {
+        "target": target.name,
+        "scenario": name,
+        "questions": len(ids),
+        "concurrency": concurrency,
+        "operations": len(latencies),
+        "requests": requests,
+        "errors": len(errors),
+        "firstError": errors[0] if errors else None,
+        "durationSeconds": round(elapsed, 4),
+        "operationsPerSecond": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "requestsPerSecond": round(requests / elapsed, 2) if elapsed else None,
+        "latencyMs": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+            "p95": round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+            "p99": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+            "max": round(latencies[-1] * 1000, 3) if latencies else None,
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    results = []
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        started = time.perf_counter()
+        ids = seed(size, args.participations, rng)
+        print(f"{size} questions, {args.participations} participations créées en "
+              f"{time.perf_counter() - started:.1f}s", file=sys.stderr)
+        for target_name in args.targets:
+            target = TestClientTarget() if target_name == 'test-client' else WSGIServerTarget()
+            try:
+                _, data = target.request('POST', '/login', {"password": app.config['ADMIN_PASSWORD']})
+                token = json.loads(data)['token']
+                for name in args.scenarios:
+                    result = run_scenario(target, name, ids, token, args, args.seed)
+                    results.append(result)
+                    print(f"  {target.name:<12} {name:<20} {result['operationsPerSecond']:>10} op/s  "
+                          f"p50 {result['latencyMs']['p50']} ms  p99 {result['latencyMs']['p99']} ms",
+                          file=sys.stderr)
+            finally:
+                target.close()
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.utcnow().isoformat() + 'Z',
+        "parameters": {
+            "sizes": args.sizes,
+            "participations": args.participations,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "sessionQuestions": args.session_questions,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--participations', type=int, default=1000000)
+    parser.add_argument('--targets', nargs='+', choices=['test-client', 'wsgi'], default=['test-client', 'wsgi'])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--iterations', type=int, default=500, help="opérations mesurées par scénario")
+    parser.add_argument('--warmup', type=int, default=5, help="opérations non mesurées par thread")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--session-questions', type=int, default=10,
+                        help="questions lues une par une dans player_session")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="fichier JSON de sortie (défaut: sortie standard)")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
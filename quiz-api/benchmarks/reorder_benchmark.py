@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark des réordonnancements de questions (déplacement, insertion, suppression)
+
+Mesure, pour plusieurs tailles de quiz, le temps et le nombre de requêtes SQL
+de chaque opération. Le nombre de requêtes doit rester constant quelle que
+soit la taille du quiz.
+
+Usage: python benchmarks/reorder_benchmark.py [--sizes 10 100 2000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ['SQL_QUERY_COUNTING'] = '1'
+
+from sqlalchemy import insert  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Question, Answer  # noqa: E402
+
+
+def seed(size):
+    """Create a quiz of `size` questions with bulk inserts"""
+    with app.app_context():
+        db.session.execute(insert(Question), [
+            {"position": i, "title": f"Question {i}", "text": "Texte"} for i in range(1, size + 1)
+        ])
+        ids = [row.id for row in db.session.query(Question.id).order_by(Question.position)]
+        db.session.execute(insert(Answer), [
+            {"question_id": question_id, "text": f"Réponse {j}", "is_correct": j == 1, "order": j}
+            for question_id in ids for j in range(1, 5)
+        ])
+        db.session.commit()
+        return ids
+
+
+def timed(call):
+    start = time.perf_counter()
+    response = call()
+    elapsed = time.perf_counter() - start
+    assert response.status_code in (200, 204), response.get_data(as_text=True)
+    return elapsed * 1000, int(response.headers['X-Query-Count'])
+
+
+def run(sizes, repeat):
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()  # Logging in records an admin session
+    token = client.post('/login', json={'password': app.config['ADMIN_PASSWORD']}).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    question = {
+        "title": "Nouvelle", "text": "Texte", "position": 1,
+        "possibleAnswers": [{"text": str(i), "isCorrect": i == 1} for i in range(4)]
+    }
+
+    print(f"{'size':>7} {'operation':<22} {'ms (best)':>10} {'queries':>8}")
+    for size in sizes:
+        results = {}
+        for _ in range(repeat):
+            client.post('/rebuild-db', headers=headers)
+            ids = seed(size)
+            operations = {
+                "move first to last": lambda: client.put(f'/questions/{ids[0]}', json={"position": size}, headers=headers),
+                "move last to first": lambda: client.put(f'/questions/{ids[0]}', json={"position": 1}, headers=headers),
+                "insert at position 1": lambda: client.post('/questions', json=question, headers=headers),
+                "delete first": lambda: client.delete(f'/questions/{ids[1]}', headers=headers),
+            }
+            for name, call in operations.items():
+                elapsed, queries = timed(call)
+                best = results.get(name, (float('inf'), queries))[0]
+                results[name] = (min(best, elapsed), queries)
+        for name, (elapsed, queries) in results.items():
+            print(f"{size:>7} {name:<22} {elapsed:>10.2f} {queries:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 2000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark de la sérialisation JSON des questions
+
+Compare, pour GET /questions/all et GET /questions/<id>:
+- to_dict() + json stdlib (comportement d'origine de jsonify)
+- to_dict() + orjson (FastJSONProvider, si orjson est installé)
+- concaténation des fragments JSON mis en cache par question
+
+Usage: python benchmarks/serialization_benchmark.py [--questions 1000] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+from sqlalchemy import insert  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Question, Answer, question_load_options  # noqa: E402
+import serialization  # noqa: E402
+
+
+def seed(size):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(Question), [
+        {"position": i, "title": f"Question {i}", "text": "Quelle est la réponse à cette question ?"}
+        for i in range(1, size + 1)
+    ])
+    ids = [row.id for row in db.session.query(Question.id)]
+    db.session.execute(insert(Answer), [
+        {"question_id": question_id, "text": f"Réponse numéro {j}", "is_correct": j == 1, "order": j}
+        for question_id in ids for j in range(1, 5)
+    ])
+    db.session.commit()
+
+
+def measure(label, call, repeat):
+    best = min(timeit.repeat(call, number=1, repeat=repeat))
+    print(f"{label:<45} {best * 1000:>10.3f} ms")
+
+
+def run(size, repeat):
+    with app.test_request_context():
+        seed(size)
+        questions = Question.query.options(*question_load_options()).order_by(Question.position).all()
+        question = questions[0]
+        stdlib = lambda obj: json.dumps(obj, ensure_ascii=True, sort_keys=True).encode()  # noqa: E731
+
+        print(f"{size} questions, meilleur temps sur {repeat} essais")
+        print("GET /questions/all")
+        measure("  to_dict + json stdlib", lambda: stdlib({"questions": [q.to_dict() for q in questions]}), repeat)
+        if serialization.orjson is not None:
+            measure("  to_dict + orjson", lambda: serialization.dumps_bytes(
+                {"questions": [q.to_dict() for q in questions]}), repeat)
+        serialization.all_questions_json()  # warm the fragment cache
+        measure("  fragments en cache", serialization.all_questions_json, repeat)
+
+        print("GET /questions/<id>")
+        measure("  to_dict + json stdlib", lambda: stdlib(question.to_dict()), repeat * 50)
+        if serialization.orjson is not None:
+            measure("  to_dict + orjson", lambda: serialization.dumps_bytes(question.to_dict()), repeat * 50)
+        measure("  fragment en cache", lambda: serialization.question_json_by_id(question.id), repeat * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    run(args.questions, args.repeat)
@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+from sqlalchemy import insert, select, tuple_
+from models import db, Question, Answer, Participation, question_load_options
+from search import index_answers
+from images import store_question_image
+from validation import validate_question_data
+
+# Number of questions per executemany statement / per export query
+CHUNK_SIZE = 500
+
+
+def import_questions(lines, start_position):
+    """Insert questions read from NDJSON lines, in order, from start_position.
+
+    Lines are parsed and validated one at a time and inserted in chunks of
+    CHUNK_SIZE with executemany, so the whole file is never held in memory.
+    Nothing is committed: the caller commits or rolls back the session.
+
+    Returns:
+        tuple: (imported, error_message)
+    """
+    imported = 0
+    chunk = []
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return imported, f"Line {line_number}: invalid JSON"
+
+        error_message = validate_question_data(data, require_position=False)
+        if error_message:
+            return imported, f"Line {line_number}: {error_message}"
+        image, image_hash, error_message = store_question_image(data.get('image'))
+        if error_message:
+            return imported, f"Line {line_number}: {error_message}"
+
+        chunk.append(({
+            "position": start_position + imported,
+            "title": data.get('title'),
+            "text": data.get('text'),
+            "image": image,
+            "image_hash": image_hash
+        }, data['possibleAnswers']))
+        imported += 1
+        if len(chunk) >= CHUNK_SIZE:
+            _insert_chunk(chunk)
+            chunk = []
+
+    if chunk:
+        _insert_chunk(chunk)
+    return imported, None
+
+
+def _insert_chunk(chunk):
+    question_ids = db.session.scalars(
+        insert(Question).returning(Question.id, sort_by_parameter_order=True),
+        [question for question, _ in chunk]
+    ).all()
+    db.session.execute(insert(Answer), [
+        {
+            "question_id": question_id,
+            "text": answer.get('text'),
+            "is_correct": answer.get('isCorrect', False),
+            "order": i + 1
+        }
+        for question_id, (_, answers) in zip(question_ids, chunk)
+        for i, answer in enumerate(answers)
+    ])
+    index_answers(question_ids)
+
+
+def export_questions():
+    """Yield every question as an NDJSON line, in position order.
+
+    Questions are read CHUNK_SIZE at a time with keyset pagination on
+    position, so memory use does not depend on the size of the quiz.
+    """
+    last_position = 0
+    while True:
+        questions = db.session.scalars(
+            select(Question)
+            .options(*question_load_options())
+            .where(Question.position > last_position)
+            .order_by(Question.position)
+            .limit(CHUNK_SIZE)
+        ).all()
+        if not questions:
+            return
+        for question in questions:
+            yield json.dumps(question.to_dict()) + '\n'
+        last_position = questions[-1].position
+        # Release the chunk before loading the next one
+        db.session.expunge_all()
+
+
+PARTICIPATION_FIELDS = ['id', 'playerName', 'score', 'createdAt']
+
+
+def export_participations(output_format='ndjson', since=None, until=None):
+    """Yield participations as NDJSON lines or CSV rows, oldest first.
+
+    Rows are read CHUNK_SIZE at a time with keyset pagination on
+    (created_at, id), which the index serves directly, so each page costs
+    the same whatever the size of the table and memory stays constant.
+    """
+    query = select(Participation.id, Participation.player_name, Participation.score, Participation.created_at)
+    if since is not None:
+        query = query.where(Participation.created_at >= since)
+    if until is not None:
+        query = query.where(Participation.created_at < until)
+    query = query.order_by(Participation.created_at, Participation.id).limit(CHUNK_SIZE)
+
+    if output_format == 'csv':
+        yield ','.join(PARTICIPATION_FIELDS) + '\r\n'
+
+    last_key = None
+    while True:
+        page_query = query
+        if last_key is not None:
+            page_query = page_query.where(tuple_(Participation.created_at, Participation.id) > last_key)
+        rows = db.session.execute(page_query).all()
+        if not rows:
+            return
+
+        records = [[row.id, row.player_name, row.score, row.created_at.isoformat()] for row in rows]
+        if output_format == 'csv':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(records)
+            yield buffer.getvalue()
+        else:
+            yield ''.join(json.dumps(dict(zip(PARTICIPATION_FIELDS, record))) + '\n' for record in records)
+        last_key = (rows[-1].created_at, rows[-1].id)
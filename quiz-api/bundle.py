@@ -0,0 +1,81 @@
+import gzip
+import json
+import threading
+import zlib
+from flask import current_app
+from models import Question, question_load_options
+from quiz_state import get_quiz_version
+
+try:
+    import brotli
+except ImportError:  # Optional, deflate is offered instead
+    brotli = None
+
+# Encodings the bundle is kept in, in server preference order
+ENCODINGS = ('br', 'gzip', 'identity') if brotli is not None else ('gzip', 'deflate', 'identity')
+
+class QuizBundle:
+    """The whole playable quiz (no correct answers), serialized and
+    compressed once per quiz version."""
+
+    def __init__(self, body, version, image_size=None):
+        self.version = version
+        self.image_size = image_size
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body)
+        else:
+            self.bodies['deflate'] = zlib.compress(body, 9)
+
+    def etag(self, encoding):
+        # Each encoding is a different representation, so it gets its own strong ETag
+        if self.image_size:
+            return f'quiz-{self.version}-{self.image_size}-{encoding}'
+        return f'quiz-{self.version}-{encoding}'
+
+
+class BundleCache:
+    """Bundles of an app (in this process), by image size"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bundles = {}  # image size -> QuizBundle
+
+
+def init_quiz_bundles(app):
+    app.extensions['quiz_bundles'] = BundleCache()
+
+
+def build_quiz_bundle(version, image_size=None):
+    questions = Question.query.options(*question_load_options()).order_by(Question.position).all()
+    body = json.dumps({
+        "version": version,
+        "size": len(questions),
+        "questions": [
+            {
+                "position": question.position,
+                "title": question.title,
+                "text": question.text,
+                "image": question.image_ref(image_size),
+                "possibleAnswers": [{"text": answer.text} for answer in question.answers]
+            }
+            for question in questions
+        ]
+    }, separators=(',', ':')).encode()
+    return QuizBundle(body, version, image_size)
+
+
+def get_quiz_bundle(image_size=None):
+    """Return the cached bundle, rebuilding it if the quiz version changed"""
+    cache = current_app.extensions['quiz_bundles']
+    version = get_quiz_version()
+    bundle = cache.bundles.get(image_size)
+    if bundle is not None and bundle.version == version:
+        return bundle
+
+    bundle = build_quiz_bundle(version, image_size)
+    with cache.lock:
+        # Only publish the bundle if no mutation happened while it was being built
+        if version == get_quiz_version():
+            cache.bundles[image_size] = bundle
+    return bundle
@@ -0,0 +1,32 @@
+import os
+import tempfile
+import pytest
+
+# Point the app at a throwaway database before it is imported
+_db_dir = tempfile.mkdtemp(prefix='quiz-api-tests-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_db_dir, 'quiz.db')}")
+os.environ.setdefault('SQL_QUERY_COUNTING', '1')
+os.environ.setdefault('RATE_LIMITING', '0')
+os.environ.setdefault('IMAGE_STORE_PATH', os.path.join(_db_dir, 'images'))
+os.environ.setdefault('SNAPSHOT_PATH', os.path.join(_db_dir, 'snapshots'))
+
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+
+with app.app_context():
+    db.create_all()
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def auth_headers(client):
+    response = client.post('/login', json={'password': app.config['ADMIN_PASSWORD']})
+    headers = {'Authorization': f"Bearer {response.get_json()['token']}"}
+    client.post('/rebuild-db', headers=headers)
+    return headers
@@ -0,0 +1,42 @@
+from sqlalchemy import event
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def init_sqlite(app, db):
+    """Apply the SQLite settings to every new connection of the app's engine.
+
+    WAL lets readers of every worker process run while one of them writes,
+    busy_timeout makes a writer wait for the lock instead of failing with
+    "database is locked", and synchronous=NORMAL only fsyncs on checkpoints,
+    which cannot corrupt a WAL database.
+    """
+    synchronous = app.config['SQLITE_SYNCHRONOUS'].upper()
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_MODES)}")
+    busy_timeout = int(app.config['SQLITE_BUSY_TIMEOUT_MS'])
+    wal = app.config['SQLITE_WAL']
+
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if wal:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.close()
+
+
+def dispose_inherited_connections(app, db):
+    """Forget the pooled connections copied from the parent process.
+
+    Called in each worker right after fork: a SQLite connection must not be
+    shared between processes, so every worker opens its own.
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,95 @@
+import threading
+from array import array
+from flask import current_app
+from sqlalchemy.orm import selectinload
+from models import Question
+from quiz_state import get_quiz_version
+
+
+class AnswerKey:
+    """Correct answer position (1-based) of each question, in quiz order.
+
+    A position of 0 means the question has no correct answer.
+    """
+
+    def __init__(self, correct_positions, version, question_ids=()):
+        self.correct_positions = array('H', correct_positions)
+        self.version = version
+        self.question_ids = tuple(question_ids)
+        self.layout_id = None  # QuizLayout of question_ids, set on first submission
+
+    def __len__(self):
+        return len(self.correct_positions)
+
+    def grade(self, answers):
+        """Grade a list of selected positions, returns (score, answers_summaries)"""
+        score = 0
+        answers_summaries = []
+        for selected, correct in zip(answers, self.correct_positions):
+            if not correct:
+                continue
+            was_correct = selected == correct
+            if was_correct:
+                score += 1
+            answers_summaries.append({
+                "correctAnswerPosition": correct,
+                "wasCorrect": was_correct
+            })
+        return score, answers_summaries
+
+
+class AnswerKeyCache:
+    """Compiled answer key shared by every request of an app (in this process)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.answer_key = None
+
+
+def init_answer_key(app):
+    app.extensions['answer_key'] = AnswerKeyCache()
+
+
+def compile_answer_key(version):
+    """Build the answer key from the database"""
+    questions = Question.query.options(selectinload(Question.answers)).order_by(Question.position).all()
+    correct_positions = []
+    for question in questions:
+        # Answers are loaded in their display order
+        correct_positions.append(
+            next((j + 1 for j, a in enumerate(question.answers) if a.is_correct), 0)
+        )
+    return AnswerKey(correct_positions, version, [question.id for question in questions])
+
+
+def get_answer_key():
+    """Return the cached answer key, compiling it if the quiz version changed"""
+    cache = current_app.extensions['answer_key']
+    version = get_quiz_version()
+    answer_key = cache.answer_key
+    if answer_key is not None and answer_key.version == version:
+        return answer_key
+
+    answer_key = compile_answer_key(version)
+    with cache.lock:
+        # Only publish the key if no mutation happened while it was being built
+        if version == get_quiz_version():
+            cache.answer_key = answer_key
+    return answer_key
+
+
+def peek_answer_key(version):
+    """The cached answer key of this quiz version, or None (never touches the database)"""
+    answer_key = current_app.extensions['answer_key'].answer_key
+    if answer_key is not None and answer_key.version == version:
+        return answer_key
+    return None
+
+
+def publish_answer_key(answer_key):
+    """Cache an answer key compiled by another code path (async reads),
+    unless a key of a newer quiz version is already cached"""
+    cache = current_app.extensions['answer_key']
+    with cache.lock:
+        if cache.answer_key is None or cache.answer_key.version <= answer_key.version:
+            cache.answer_key = answer_key
@@ -0,0 +1,65 @@
+"""
+Configuration gunicorn du serveur de production
+
+Plusieurs processus (un par cœur par défaut) avec plusieurs threads chacun.
+L'application est chargée une fois dans le processus maître (preload) puis
+chaque worker ouvre ses propres connexions SQLite après le fork.
+
+Avec SERVER_MODE=async, chaque worker sert les lectures publiques sur une
+boucle d'événements (uvicorn, voir asgi.py) et le reste de l'API dans un
+pool de threads.
+
+Usage: gunicorn -c gunicorn.conf.py
+"""
+import multiprocessing
+import os
+
+# Read by the app when it is preloaded: each worker's caches re-read the
+# quiz version, leaderboard and revoked tokens at most every second
+os.environ.setdefault('CACHE_REVALIDATE_SECONDS', '1')
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+wsgi_app = 'app:app'
+if os.environ.get('SERVER_MODE', 'sync') == 'async':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'asgi:app'
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+# On SIGTERM, workers finish their in-flight requests for up to this long
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('KEEPALIVE', '5'))
+# Recycle workers after this many requests (0: never)
+max_requests = int(os.environ.get('MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', '0'))
+
+accesslog = os.environ.get('ACCESS_LOG')  # '-' for stdout
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    # Runs in the master once, before the workers are forked
+    from app import init_database
+    init_database()
+
+
+def post_fork(server, worker):
+    from app import app
+    from database import dispose_inherited_connections
+    from models import db
+    dispose_inherited_connections(app, db)
+
+
+def worker_exit(server, worker):
+    # Commit the participations still queued in this worker, finish its image jobs
+    from app import app
+    participation_batcher = app.extensions.get('participation_batcher')
+    if participation_batcher is not None:
+        participation_batcher.stop()
+    image_processor = app.extensions.get('image_processor')
+    if image_processor is not None:
+        image_processor.stop()
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import re
+import tempfile
+from flask import current_app
+from validation import decode_base64_image
+
+# Image type (from the data URL header) -> file extension and MIME type
+IMAGE_TYPES = {
+    'jpeg': ('jpg', 'image/jpeg'),
+    'jpg': ('jpg', 'image/jpeg'),
+    'png': ('png', 'image/png'),
+    'gif': ('gif', 'image/gif'),
+    'webp': ('webp', 'image/webp'),
+}
+MIME_TYPES = {extension: mimetype for extension, mimetype in IMAGE_TYPES.values()}
+
+IMAGE_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+IMAGE_URL_RE = re.compile(r'(?:^|/)images/([0-9a-f]{64})(?:[?#].*)?$')
+
+
+def get_image_store_path():
+    path = current_app.config['IMAGE_STORE_PATH']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def save_image(image_data, image_type):
+    """Store decoded image bytes under their SHA-256 and return the hash.
+
+    Identical images are stored once.
+    """
+    image_hash = hashlib.sha256(image_data).hexdigest()
+    extension, _ = IMAGE_TYPES[image_type]
+    store_path = get_image_store_path()
+    path = os.path.join(store_path, f'{image_hash}.{extension}')
+    if not os.path.exists(path):
+        write_file_atomically(path, image_data)
+    return image_hash
+
+
+def write_file_atomically(path, data):
+    # Write to a temporary file first so readers never see a partial image
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def find_image(image_hash):
+    """Return (path, mimetype) of a stored image, or None"""
+    if not IMAGE_HASH_RE.match(image_hash):
+        return None
+    store_path = get_image_store_path()
+    for extension, mimetype in MIME_TYPES.items():
+        path = os.path.join(store_path, f'{image_hash}.{extension}')
+        if os.path.exists(path):
+            return path, mimetype
+    return None
+
+
+def find_image_variant(image_hash, variant):
+    """Return (path, mimetype) of a processed variant of a stored image, or None"""
+    if not IMAGE_HASH_RE.match(image_hash):
+        return None
+    store_path = get_image_store_path()
+    for extension, mimetype in MIME_TYPES.items():
+        path = os.path.join(store_path, f'{image_hash}-{variant}.{extension}')
+        if os.path.exists(path):
+            return path, mimetype
+    return None
+
+
+def parse_image_url(value):
+    """Return the hash of a stored image referenced by URL (e.g. /images/<hash>), or None"""
+    if not isinstance(value, str):
+        return None
+    match = IMAGE_URL_RE.search(value.strip())
+    if match and find_image(match.group(1)):
+        return match.group(1)
+    return None
+
+
+def image_url(image_hash, size=None):
+    if size:
+        return f'/images/{image_hash}?size={size}'
+    return f'/images/{image_hash}'
+
+
+def store_question_image(value):
+    """Turn the `image` field of a question payload into (image, image_hash, error_message).
+
+    Base64 data URLs are decoded once and moved to the image store, URLs of
+    already stored images are kept as references, anything else is kept as is.
+    """
+    image_data, image_type, error_message = decode_base64_image(value)
+    if error_message:
+        return None, None, error_message
+    if image_data is not None:
+        return None, save_image(image_data, image_type), None
+    image_hash = parse_image_url(value)
+    if image_hash:
+        return None, image_hash, None
+    return value, None, None
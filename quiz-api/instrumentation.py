@@ -0,0 +1,26 @@
+from flask import g, has_app_context
+from sqlalchemy import event
+
+
+def init_query_counter(app, db):
+    """Count the SQL statements issued by each request.
+
+    The count is exposed in the X-Query-Count response header so tests can
+    assert a query budget per endpoint.
+    """
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if has_app_context() and 'query_count' in g:
+            g.query_count += 1
+
+    @app.before_request
+    def reset_query_count():
+        g.query_count = 0
+
+    @app.after_request
+    def add_query_count_header(response):
+        response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+        return response
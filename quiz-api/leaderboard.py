@@ -0,0 +1,119 @@
+import hashlib
+import json
+import threading
+import time
+from bisect import bisect_right
+from flask import current_app
+from werkzeug.local import LocalProxy
+from models import Participation
+from quiz_state import revalidation_due
+
+
+class Leaderboard:
+    """Top-N participations kept in memory, ordered like
+    ORDER BY score DESC, created_at DESC.
+
+    The list is seeded from the database on first use and then maintained
+    incrementally, so reading it never touches the database. With several
+    worker processes it is also reloaded every CACHE_REVALIDATE_SECONDS to
+    pick up the participations recorded by the other workers.
+    """
+
+    def __init__(self, size=10):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = None  # sorted list of (sort_key, participation dict)
+        self._digest = None
+        self._loaded_at = 0.0
+        self.changes = 0  # Bumped by add() and reset(), see load()
+
+    @staticmethod
+    def _sort_key(score, created_at):
+        return (-score, -created_at.timestamp())
+
+    def _load(self):
+        participations = Participation.query.order_by(
+            Participation.score.desc(), Participation.created_at.desc()
+        ).limit(self.size).all()
+        return self._entries_of(participations)
+
+    def _entries_of(self, participations):
+        return [(self._sort_key(p.score, p.created_at), p.to_dict()) for p in participations]
+
+    @staticmethod
+    def _digest_of(scores):
+        return hashlib.sha1(json.dumps(scores).encode()).hexdigest()[:16]
+
+    def _set_entries(self, entries):
+        self._entries = entries
+        self._digest = self._digest_of([entry for _, entry in entries] if entries is not None else None)
+
+    def _ensure_loaded(self):
+        entries = self._entries
+        if entries is None or revalidation_due(self._loaded_at):
+            with self._lock:
+                if self._entries is None or revalidation_due(self._loaded_at):
+                    self._set_entries(self._load())
+                    self._loaded_at = time.monotonic()
+                entries = self._entries
+        return entries
+
+    def top(self):
+        """Return the top-N scores as dicts"""
+        return [entry for _, entry in self._ensure_loaded()]
+
+    def digest(self):
+        """Short hash of the current top-N, changes whenever the scores change"""
+        self._ensure_loaded()
+        return self._digest
+
+    def peek(self):
+        """(top-N, digest) when they can be served from memory, else None"""
+        entries, digest = self._entries, self._digest
+        if entries is None or revalidation_due(self._loaded_at):
+            return None
+        return [entry for _, entry in entries], digest
+
+    def load(self, participations, changes):
+        """Replace the top-N with participations read by another code path
+        (async reads), ordered like the database query.
+
+        `changes` is the value of self.changes before the read: if a
+        participation was recorded meanwhile, the read may miss it and is
+        not kept. Returns (top-N, digest) of what was read.
+        """
+        entries = self._entries_of(participations[:self.size])
+        with self._lock:
+            if changes == self.changes:
+                self._set_entries(entries)
+                self._loaded_at = time.monotonic()
+        scores = [entry for _, entry in entries]
+        return scores, self._digest_of(scores)
+
+    def add(self, score, created_at, participation_dict):
+        """Record a newly committed participation"""
+        entry = (self._sort_key(score, created_at), participation_dict)
+        with self._lock:
+            self.changes += 1
+            if self._entries is None:
+                return  # Not seeded yet, the next load will read it from the database
+            if len(self._entries) >= self.size and entry[0] >= self._entries[-1][0]:
+                return
+            entries = list(self._entries)
+            index = bisect_right([key for key, _ in entries], entry[0])
+            entries.insert(index, entry)
+            self._set_entries(entries[:self.size])
+
+    def reset(self, empty=True):
+        """Clear the leaderboard; with empty=False it is reloaded on next read"""
+        with self._lock:
+            self.changes += 1
+            self._set_entries([] if empty else None)
+
+
+def init_leaderboard(app):
+    app.extensions['leaderboard'] = Leaderboard()
+
+
+# Leaderboard of the current app
+leaderboard = LocalProxy(lambda: current_app.extensions['leaderboard'])
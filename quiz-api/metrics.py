@@ -0,0 +1,193 @@
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from werkzeug.local import LocalProxy
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class _Shard:
+    """Counters written by a single thread, so recording needs no lock"""
+
+    def __init__(self):
+        self.requests = {}        # (route, method, status) -> count
+        self.latency = {}         # (route, method) -> [bucket counts..., +Inf count, sum]
+        self.in_flight = {}       # route -> requests started - requests finished
+        self.sql = {}             # route -> [statement count, total seconds]
+        self.exceptions = {}      # (route, exception type) -> count
+
+
+class Metrics:
+    """Request and SQL metrics of an app in this process, exported in
+    Prometheus text format.
+
+    Each thread records into its own shard; a scrape merges every shard.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()  # Only taken once per thread and per scrape
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def request_started(self, route):
+        in_flight = self._shard().in_flight
+        in_flight[route] = in_flight.get(route, 0) + 1
+
+    def request_finished(self, route, method, status, duration):
+        shard = self._shard()
+        shard.in_flight[route] = shard.in_flight.get(route, 0) - 1
+        key = (route, method, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        histogram = shard.latency.get((route, method))
+        if histogram is None:
+            histogram = shard.latency[(route, method)] = [0] * (len(LATENCY_BUCKETS) + 2)
+        histogram[bisect_left(LATENCY_BUCKETS, duration)] += 1
+        histogram[-1] += duration
+
+    def statement_executed(self, route, duration):
+        sql = self._shard().sql
+        stats = sql.get(route)
+        if stats is None:
+            stats = sql[route] = [0, 0.0]
+        stats[0] += 1
+        stats[1] += duration
+
+    def exception_raised(self, route, exception_type):
+        exceptions = self._shard().exceptions
+        key = (route, exception_type)
+        exceptions[key] = exceptions.get(key, 0) + 1
+
+    def _merged(self, attribute):
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            # dict.copy() is atomic, the owning thread may keep writing meanwhile
+            for key, value in getattr(shard, attribute).copy().items():
+                if isinstance(value, list):
+                    current = merged.setdefault(key, [0] * len(value))
+                    for i, v in enumerate(value):
+                        current[i] += v
+                else:
+                    merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def render(self, extra_lines=()):
+        """Prometheus text exposition of every metric"""
+        lines = [
+            '# HELP quiz_http_requests_total HTTP requests handled.',
+            '# TYPE quiz_http_requests_total counter',
+        ]
+        for (route, method, status), count in sorted(self._merged('requests').items()):
+            lines.append(f'quiz_http_requests_total{_labels(route=route, method=method, status=status)} {count}')
+
+        lines += [
+            '# HELP quiz_http_request_duration_seconds HTTP request latency.',
+            '# TYPE quiz_http_request_duration_seconds histogram',
+        ]
+        for (route, method), histogram in sorted(self._merged('latency').items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram[:-1]):
+                cumulative += count
+                labels = _labels(route=route, method=method, le=str(bound))
+                lines.append(f'quiz_http_request_duration_seconds_bucket{labels} {cumulative}')
+            labels = _labels(route=route, method=method)
+            lines.append(f'quiz_http_request_duration_seconds_sum{labels} {histogram[-1]:.6f}')
+            lines.append(f'quiz_http_request_duration_seconds_count{labels} {cumulative}')
+
+        lines += [
+            '# HELP quiz_http_requests_in_flight HTTP requests being handled.',
+            '# TYPE quiz_http_requests_in_flight gauge',
+        ]
+        for route, count in sorted(self._merged('in_flight').items()):
+            lines.append(f'quiz_http_requests_in_flight{_labels(route=route)} {count}')
+
+        lines += [
+            '# HELP quiz_sql_statements_total SQL statements executed, by route.',
+            '# TYPE quiz_sql_statements_total counter',
+        ]
+        sql = sorted(self._merged('sql').items())
+        for route, (count, _) in sql:
+            lines.append(f'quiz_sql_statements_total{_labels(route=route)} {count}')
+        lines += [
+            '# HELP quiz_sql_statement_duration_seconds_total Time spent executing SQL statements, by route.',
+            '# TYPE quiz_sql_statement_duration_seconds_total counter',
+        ]
+        for route, (_, duration) in sql:
+            lines.append(f'quiz_sql_statement_duration_seconds_total{_labels(route=route)} {duration:.6f}')
+
+        lines += [
+            '# HELP quiz_unexpected_exceptions_total Exceptions caught by the generic 500 handler.',
+            '# TYPE quiz_unexpected_exceptions_total counter',
+        ]
+        for (route, exception_type), count in sorted(self._merged('exceptions').items()):
+            lines.append(f'quiz_unexpected_exceptions_total{_labels(route=route, exception=exception_type)} {count}')
+
+        lines.extend(extra_lines)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def current_route():
+    """Route template of the current request, used as the metrics label"""
+    if not has_request_context():
+        return 'background'
+    if request.url_rule is None:
+        return 'unmatched'
+    return request.url_rule.rule
+
+
+# Metrics of the current app, always present: unexpected exceptions are
+# counted even when METRICS is off
+metrics = LocalProxy(lambda: current_app.extensions['metrics'])
+
+
+def init_metrics(app, db):
+    """Record request and SQL metrics for every request of the app"""
+    app_metrics = app.extensions['metrics']
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_statement_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('metrics_statement_start')
+        if starts:
+            app_metrics.statement_executed(current_route(), time.perf_counter() - starts.pop())
+
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_route = current_route()
+        app_metrics.request_started(g.metrics_route)
+
+    # Run first so that requests rejected by other before_request hooks are counted too
+    app.before_request_funcs.setdefault(None, []).insert(0, start_request_timer)
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            app_metrics.request_finished(g.metrics_route, request.method, response.status_code,
+                                     time.perf_counter() - start)
+        return response
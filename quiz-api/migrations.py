@@ -0,0 +1,112 @@
+import logging
+from sqlalchemy import MetaData, event, inspect
+from sqlalchemy.orm import undefer_group
+from sqlalchemy.schema import CreateTable
+from images import store_question_image
+from models import db, Question
+from quiz_state import commit_quiz_change
+
+logger = logging.getLogger(__name__)
+
+# Columns added to existing tables since the first release: create_all()
+# only creates missing tables, it never alters an existing one.
+# (table, column, SQLite column definition)
+ADDED_COLUMNS = (
+    ('question', 'image_hash', 'VARCHAR(64)'),
+    ('admin_session', 'revoked', 'BOOLEAN NOT NULL DEFAULT 0'),
+    ('participation', 'choices', 'BLOB'),
+    ('participation', 'layout_id', 'INTEGER REFERENCES quiz_layout (id)'),
+    ('quiz_state', 'scores_version', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+# Questions whose image is moved to the image store per transaction
+BACKFILL_CHUNK_SIZE = 100
+
+
+@event.listens_for(db.metadata, 'before_create')
+def upgrade_schema(target, connection, **kw):
+    """Bring the tables of an existing SQLite database up to the models,
+    every time create_all() runs (at startup, see init_database).
+
+    Idempotent: only the missing columns and indexes are added, existing
+    rows are kept. Other databases need a migration tool.
+    """
+    if connection.dialect.name != 'sqlite':
+        return
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    for table_name, column_name, definition in ADDED_COLUMNS:
+        if table_name not in existing_tables:
+            continue  # Created with all its columns by create_all()
+        columns = {column['name'] for column in inspector.get_columns(table_name)}
+        if column_name not in columns:
+            connection.exec_driver_sql(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}')
+    if 'question' in existing_tables:
+        _add_question_autoincrement(connection, existing_tables)
+    # Indexes declared on the models after their table was created
+    for table in target.sorted_tables:
+        if table.name in existing_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+def _add_question_autoincrement(connection, existing_tables):
+    """Rebuild a question table created without AUTOINCREMENT.
+
+    Without it SQLite hands the id of the last deleted question to the next
+    one, which would then inherit the choice counters and quiz layouts
+    (see stats.py) of the deleted question. The sequence starts after every
+    id still referenced. The search triggers go with the old table and are
+    created again by create_search_index().
+    """
+    sql = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'question'"
+    ).scalar()
+    if 'AUTOINCREMENT' in sql.upper():
+        return
+    upgraded = Question.__table__.to_metadata(MetaData(), name='question_upgrade')
+    columns = ', '.join(f'"{column.name}"' for column in upgraded.columns)
+    connection.execute(CreateTable(upgraded))
+    connection.exec_driver_sql(f'INSERT INTO question_upgrade ({columns}) SELECT {columns} FROM question')
+    connection.exec_driver_sql('DROP TABLE question')
+    connection.exec_driver_sql('ALTER TABLE question_upgrade RENAME TO question')
+
+    last_id = connection.exec_driver_sql('SELECT max(id) FROM question').scalar() or 0
+    if 'answer_choice_count' in existing_tables:
+        last_id = max(last_id, connection.exec_driver_sql(
+            'SELECT max(question_id) FROM answer_choice_count').scalar() or 0)
+    if 'quiz_layout' in existing_tables:
+        for (question_ids,) in connection.exec_driver_sql('SELECT question_ids FROM quiz_layout'):
+            last_id = max([last_id] + [int(i) for i in question_ids.split(',') if i])
+    connection.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'question'")
+    connection.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES ('question', ?)", (last_id,))
+
+
+def backfill_question_images(chunk_size=BACKFILL_CHUNK_SIZE):
+    """Move the base64 data URLs stored inline in question.image (first
+    release) to the image store, at startup (needs an app context).
+
+    Idempotent: only the questions still holding a data URL are read, an
+    image that fails validation is kept inline. Returns the number of
+    questions moved.
+    """
+    moved = 0
+    last_id = 0
+    while True:
+        questions = Question.query.options(undefer_group('image')).filter(
+            Question.image.like('data:image/%'), Question.id > last_id
+        ).order_by(Question.id).limit(chunk_size).all()
+        if not questions:
+            break
+        for question in questions:
+            image, image_hash, error_message = store_question_image(question.image)
+            if error_message:
+                logger.warning("Image of question %s kept inline: %s", question.id, error_message)
+                continue
+            question.image, question.image_hash = image, image_hash
+            moved += 1
+        last_id = questions[-1].id
+        db.session.commit()
+    if moved:
+        commit_quiz_change()  # The questions are served with their image URL now
+    return moved
@@ -1,5 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import deferred, selectinload, undefer_group
 from datetime import datetime
+from images import image_url
 
 db = SQLAlchemy()
 
@@ -8,28 +10,58 @@ class Question(db.Model):
     position = db.Column(db.Integer, unique=True, nullable=True)
     title = db.Column(db.String(200), nullable=False)
     text = db.Column(db.Text, nullable=False)
-    image = db.Column(db.Text)  # Base64 encoded image
+    # Image columns are only read when requested (see question_load_options)
+    image = deferred(db.Column(db.Text), group='image')  # Image value not in the image store (e.g. an external URL)
+    image_hash = deferred(db.Column(db.String(64)), group='image')  # SHA-256 of the image in the image store
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Relationship
-    answers = db.relationship('Answer', backref='question', lazy=True, cascade='all, delete-orphan')
+    # Relationship, always loaded in answer order (use selectinload on read paths)
+    answers = db.relationship('Answer', backref='question', lazy=True, order_by='Answer.order',
+                              cascade='all, delete-orphan')
+
+    # Ids are never reused: choice counters and quiz layouts refer to them
+    __table_args__ = {'sqlite_autoincrement': True}
     
-    def to_dict(self):
-        # Sort answers by order field to ensure consistent ordering
-        sorted_answers = sorted(self.answers, key=lambda a: a.order)
+    def to_dict(self, fields=None, image_size=None):
+        if fields is not None:
+            # Projection: only compute the requested fields
+            getters = {
+                'id': lambda: self.id,
+                'position': lambda: self.position,
+                'title': lambda: self.title,
+                'text': lambda: self.text,
+                'image': lambda: self.image_ref(image_size),
+                'possibleAnswers': lambda: [answer.to_dict() for answer in self.answers]
+            }
+            return {field: getters[field]() for field in QUESTION_FIELDS if field in fields}
         return {
             'id': self.id,
             'position': self.position,
             'title': self.title,
             'text': self.text,
-            'image': self.image,
-            'possibleAnswers': [answer.to_dict() for answer in sorted_answers]
+            'image': self.image_ref(image_size),
+            'possibleAnswers': [answer.to_dict() for answer in self.answers]
         }
+    
+    def image_ref(self, size=None):
+        """URL of the stored image (of a processed variant if `size` is given)"""
+        return image_url(self.image_hash, size) if self.image_hash else self.image
+
+QUESTION_FIELDS = ('id', 'position', 'title', 'text', 'image', 'possibleAnswers')
+
+def question_load_options(fields=None):
+    """Loader options reading what to_dict(fields) needs in a fixed number of queries"""
+    options = []
+    if fields is None or 'image' in fields:
+        options.append(undefer_group('image'))
+    if fields is None or 'possibleAnswers' in fields:
+        options.append(selectinload(Question.answers))
+    return options
 
 class Answer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False, index=True)
     text = db.Column(db.String(500), nullable=False)
     is_correct = db.Column(db.Boolean, nullable=False, default=False)
     order = db.Column(db.Integer, nullable=False, default=0)
@@ -47,6 +79,17 @@ class Participation(db.Model):
     player_name = db.Column(db.String(100), nullable=False)
     score = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Chosen answer position of each question, one byte per question (0: none),
+    # in the question order of `layout_id` (see stats.py)
+    choices = deferred(db.Column(db.LargeBinary))
+    layout_id = db.Column(db.Integer, db.ForeignKey('quiz_layout.id'), nullable=True)
+    
+    # Serves the leaderboard ORDER BY score DESC, created_at DESC
+    # and the keyset-paginated export on (created_at, id)
+    __table_args__ = (
+        db.Index('ix_participation_score_created_at', score.desc(), created_at.desc()),
+        db.Index('ix_participation_created_at_id', created_at, id),
+    )
     
     def to_dict(self):
         return {
@@ -57,6 +100,28 @@ class Participation(db.Model):
 
 class AdminSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    token = db.Column(db.String(200), unique=True, nullable=False)
+    token = db.Column(db.String(200), unique=True, nullable=False)  # SHA-256 of the JWT
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
+    revoked = db.Column(db.Boolean, nullable=False, default=False)
+
+class QuizState(db.Model):
+    """Single row holding the quiz version, bumped by every admin mutation,
+    and the scores version, bumped when existing scores change"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    # Also defaulted by the database: snapshot restores write quiz_state in plain SQL
+    scores_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+class QuizLayout(db.Model):
+    """Ordered question ids of the quiz at the time of a participation,
+    shared by every participation made while the quiz had this order"""
+    id = db.Column(db.Integer, primary_key=True)
+    question_ids = db.Column(db.Text, nullable=False, unique=True)  # Comma-separated
+
+class AnswerChoiceCount(db.Model):
+    """Participations that chose each answer position of a question (0: no
+    valid choice), maintained with every submission"""
+    question_id = db.Column(db.Integer, primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    choices = db.Column(db.Integer, nullable=False, default=0)
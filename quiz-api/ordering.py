@@ -0,0 +1,23 @@
+from models import db, Question
+
+
+def shift_positions(start, end, delta):
+    """Shift the position of every question in [start, end] by delta.
+
+    end=None means up to the last question. This always costs two UPDATE
+    statements whatever the size of the quiz: rows are first parked below
+    the lowest position in use, so the unique constraint on position cannot
+    be hit halfway through the shift (positions may be negative or zero,
+    so no range of them is free by construction).
+    """
+    lowest, highest = db.session.query(db.func.min(Question.position), db.func.max(Question.position)).one()
+    if lowest is None:
+        return  # No question to shift
+    offset = highest - lowest + abs(delta) + 1
+    query = db.session.query(Question).filter(Question.position >= start)
+    if end is not None:
+        query = query.filter(Question.position <= end)
+    query.update({Question.position: Question.position + delta - offset}, synchronize_session=False)
+    db.session.query(Question).filter(Question.position < lowest).update(
+        {Question.position: Question.position + offset}, synchronize_session=False
+    )
@@ -0,0 +1,105 @@
+import threading
+import time
+from flask import current_app
+from models import db, QuizState
+
+
+class QuizVersionCache:
+    """In-memory copy of the persisted quiz version of an app"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None  # None until first read
+        self.checked_at = 0.0  # time.monotonic() of the last read
+
+
+def init_quiz_state(app):
+    app.extensions['quiz_version'] = QuizVersionCache()
+
+
+def _cache():
+    return current_app.extensions['quiz_version']
+
+
+def revalidation_due(checked_at):
+    """True when a cache last checked at `checked_at` must be re-read from the
+    database, because another worker process may have changed it since"""
+    interval = current_app.config.get('CACHE_REVALIDATE_SECONDS', 0)
+    return bool(interval) and time.monotonic() - checked_at > interval
+
+
+def get_quiz_version():
+    """Return the current quiz version, read from the database once per process
+    (and again every CACHE_REVALIDATE_SECONDS when several workers run)"""
+    cache = _cache()
+    version = cache.version
+    if version is None or revalidation_due(cache.checked_at):
+        with cache.lock:
+            if cache.version is None or revalidation_due(cache.checked_at):
+                # A column query, so a version cached in the session identity map is not reused
+                cache.version = db.session.query(QuizState.version).filter_by(id=1).scalar() or 0
+                cache.checked_at = time.monotonic()
+            version = cache.version
+    return version
+
+
+def peek_quiz_version():
+    """The in-memory quiz version, or None when it has to be read from the
+    database (never read yet, or due for revalidation)"""
+    cache = _cache()
+    version = cache.version
+    if version is None or revalidation_due(cache.checked_at):
+        return None
+    return version
+
+
+def record_quiz_version(version):
+    """Publish a version read from the database by another code path (async
+    reads), returns the current version"""
+    cache = _cache()
+    with cache.lock:
+        # A commit of this process may have landed while the version was read
+        cache.version = max(version, cache.version or 0)
+        cache.checked_at = time.monotonic()
+        return cache.version
+
+
+def commit_quiz_change():
+    """Commit the current session as a quiz mutation.
+
+    The persisted version is bumped in the same transaction, so it never
+    goes backwards, even across restarts or a rebuild of the database.
+    Every cache keyed on the version (answer key, ETags) is invalidated.
+    """
+    previous_version = get_quiz_version()
+    updated = db.session.query(QuizState).filter_by(id=1).update(
+        {QuizState.version: QuizState.version + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(QuizState(id=1, version=previous_version + 1))
+    db.session.flush()
+    version = db.session.query(QuizState.version).filter_by(id=1).scalar()
+    db.session.commit()
+    record_quiz_version(version)
+    return version
+
+
+def get_scores_version():
+    """Persisted scores version (never cached: only read on revalidation)"""
+    return db.session.query(QuizState.scores_version).filter_by(id=1).scalar() or 0
+
+
+def bump_scores_version():
+    """Record, in the current transaction, that scores already counted by the
+    score caches changed (regrade, deletion), so that every worker reloads
+    them. The quiz version, and every cache keyed on it, is left alone.
+    """
+    updated = db.session.query(QuizState).filter_by(id=1).update(
+        {QuizState.scores_version: QuizState.scores_version + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(QuizState(id=1, version=get_quiz_version(), scores_version=1))
+
+
+def quiz_etag():
+    return f'quiz-{get_quiz_version()}'
@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import Counter
+from flask import current_app
+from sqlalchemy import func
+from werkzeug.local import LocalProxy
+from models import db, Participation
+from quiz_state import get_quiz_version, get_scores_version, revalidation_due
+
+
+class ScoreIndex:
+    """Number of participations per score, in a Fenwick tree.
+
+    Gives the global rank of a score (1 + participations with a strictly
+    higher score) and its percentile in O(log max score), where a COUNT(*)
+    would scan the participation table.
+
+    Seeded from the database on first use with one GROUP BY, then updated
+    by add() after each committed participation. With several worker
+    processes it also reads, every CACHE_REVALIDATE_SECONDS, the rows
+    inserted since its last read (by id), in place of its own additions;
+    deletions and regrades (which bump the quiz version) make it read
+    everything again.
+    """
+
+    def __init__(self, capacity=64):
+        self._lock = threading.Lock()
+        self._tree = None  # Fenwick tree over score + 1, None until seeded
+        self._total = 0
+        self._last_id = 0  # Highest participation id read from the database
+        self._versions = None  # (quiz version, scores version) of the last full read
+        self._local = Counter()  # score -> participations added since the last read
+        self._loaded_at = 0.0
+        self._initial_capacity = capacity
+
+    def _tree_add(self, score, count):
+        if score + 1 >= len(self._tree):
+            # Scores above the current range: rebuild a tree twice as large
+            counts = [self._count(s) for s in range(len(self._tree) - 1)]
+            self._tree = [0] * max(2 * len(self._tree), score + 2)
+            for s, n in enumerate(counts):
+                if n:
+                    self._tree_add(s, n)
+        i = score + 1
+        while i < len(self._tree):
+            self._tree[i] += count
+            i += i & -i
+
+    def _increment(self, score, count):
+        self._tree_add(score, count)
+        self._total += count
+
+    def _at_or_below(self, score):
+        """Participations with a score <= `score`"""
+        i = min(score + 1, len(self._tree) - 1)
+        count = 0
+        while i > 0:
+            count += self._tree[i]
+            i -= i & -i
+        return count
+
+    def _count(self, score):
+        return self._at_or_below(score) - self._at_or_below(score - 1)
+
+    def _read_since(self, last_id):
+        """({score: count}, highest id) of the participations with an id above `last_id`"""
+        rows = db.session.query(Participation.score, func.count(), func.max(Participation.id)).filter(
+            Participation.id > last_id
+        ).group_by(Participation.score).all()
+        return {score: count for score, count, _ in rows}, max((max_id for _, _, max_id in rows), default=last_id)
+
+    @staticmethod
+    def _read_versions():
+        # A new quiz version covers a rebuilt or restored database
+        return get_quiz_version(), get_scores_version()
+
+    def _read_all(self):
+        self._tree = [0] * self._initial_capacity
+        self._total = 0
+        self._local.clear()
+        self._versions = self._read_versions()
+        counts, self._last_id = self._read_since(0)
+        return counts
+
+    def _ensure_loaded(self):
+        if self._tree is not None and not revalidation_due(self._loaded_at):
+            return
+        with self._lock:
+            if self._tree is None:
+                counts = self._read_all()
+            elif revalidation_due(self._loaded_at):
+                max_id = db.session.query(func.max(Participation.id)).scalar() or 0
+                if max_id < self._last_id or self._read_versions() != self._versions:
+                    # Participations deleted or regraded by another worker
+                    counts = self._read_all()
+                else:
+                    # The rows of this worker are in the database now, count them from there
+                    for score, count in self._local.items():
+                        self._increment(score, -count)
+                    self._local.clear()
+                    counts, self._last_id = self._read_since(self._last_id)
+            else:
+                return
+            for score, count in counts.items():
+                self._increment(score, count)
+            self._loaded_at = time.monotonic()
+
+    def seed(self):
+        """Load the index now rather than on first use"""
+        self._ensure_loaded()
+
+    def add(self, score):
+        """Record a newly committed participation"""
+        with self._lock:
+            if self._tree is None:
+                return  # Not seeded yet, the next load will read it from the database
+            self._increment(score, 1)
+            self._local[score] += 1
+
+    def rank(self, score):
+        """(rank, percentile, total) of a score among all participations.
+
+        The percentile is the share of participations with a strictly lower
+        score, None when there are none at all.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            total = self._total
+            higher = total - self._at_or_below(score)
+            lower = self._at_or_below(score - 1)
+        percentile = round(100 * lower / total, 1) if total else None
+        return higher + 1, percentile, total
+
+    def reset(self, empty=True):
+        """Clear the index; with empty=False it is read again on next use"""
+        with self._lock:
+            self._tree = [0] * self._initial_capacity if empty else None
+            self._total = 0
+            self._last_id = 0
+            self._local.clear()
+            self._loaded_at = time.monotonic()
+
+
+def init_score_index(app):
+    app.extensions['score_index'] = ScoreIndex()
+
+
+# Score index of the current app
+score_index = LocalProxy(lambda: current_app.extensions['score_index'])
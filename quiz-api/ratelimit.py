@@ -0,0 +1,128 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, jsonify, current_app
+
+
+class TokenBucketLimiter:
+    """Per-client token buckets: `rate` requests per second with bursts of `burst`.
+
+    At most `max_clients` buckets are kept, the least recently seen clients
+    are evicted first.
+    """
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # client key -> (tokens, last refill time)
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """Take a token for this client, returns (allowed, retry_after_seconds)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if allowed:
+            return True, 0
+        return False, math.ceil((1 - tokens) / self.rate)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """Caps the number of write requests running at once.
+
+    A request waits at most `max_wait` seconds for a slot, then is rejected
+    instead of piling up behind the SQLite writer lock.
+    """
+
+    def __init__(self, max_concurrent, max_wait):
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def acquire(self):
+        return self._slots.acquire(timeout=self.max_wait)
+
+    def release(self):
+        self._slots.release()
+
+
+def client_key():
+    """Identify the client by the configured header, or by IP address.
+
+    The IP address is only used with RATE_LIMIT_BY_IP: behind a reverse
+    proxy it is the proxy's, and every player would share one bucket.
+    Returns None when the client cannot be identified.
+
+    A list header like X-Forwarded-For is appended to by each proxy: the
+    client is the entry added by the first of the RATE_LIMIT_TRUSTED_PROXIES
+    trusted proxies, counted from the right. Entries further left come from
+    the client itself, which could change them on every request.
+    """
+    header = current_app.config.get('RATE_LIMIT_KEY_HEADER')
+    if header and request.headers.get(header):
+        entries = [entry.strip() for entry in request.headers[header].split(',')]
+        trusted_proxies = current_app.config.get('RATE_LIMIT_TRUSTED_PROXIES', 1)
+        if len(entries) >= trusted_proxies:
+            return entries[-trusted_proxies]
+    elif not header and not current_app.config.get('RATE_LIMIT_BY_IP', False):
+        return None
+    return request.remote_addr or 'unknown'
+
+
+def init_rate_limits(app):
+    """Create the app's limiters from its configuration.
+
+    They live in the worker process: with several workers, each one applies
+    the limits on its own.
+    """
+    app.extensions['rate_limits'] = {
+        'participation': TokenBucketLimiter(app.config['PARTICIPATION_RATE_LIMIT'],
+                                            app.config['PARTICIPATION_RATE_BURST']),
+        'login': TokenBucketLimiter(app.config['LOGIN_RATE_LIMIT'], app.config['LOGIN_RATE_BURST']),
+    }
+    app.extensions['write_admission'] = AdmissionController(app.config['WRITE_CONCURRENCY'],
+                                                            app.config['WRITE_QUEUE_WAIT_MS'] / 1000)
+
+
+def admission_controlled(limit_name):
+    """Decorator applying the named per-client rate limit (when clients can
+    be identified, see client_key) then the global concurrency cap"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not current_app.config.get('RATE_LIMITING', True):
+                return f(*args, **kwargs)
+
+            limiter = current_app.extensions['rate_limits'][limit_name]
+            admission = current_app.extensions['write_admission']
+            key = client_key()
+            allowed, retry_after = limiter.acquire(key) if key is not None else (True, 0)
+            if not allowed:
+                response = jsonify({"error": "Too many requests, please retry later"})
+                response.headers['Retry-After'] = str(retry_after)
+                return response, 429
+
+            if not admission.acquire():
+                response = jsonify({"error": "Server busy, please retry later"})
+                response.headers['Retry-After'] = str(max(1, math.ceil(admission.max_wait)))
+                return response, 503
+            try:
+                return f(*args, **kwargs)
+            finally:
+                admission.release()
+
+        return decorated
+    return decorator
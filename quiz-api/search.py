@@ -0,0 +1,158 @@
+import html
+import logging
+import re
+from flask import current_app, has_app_context
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# FTS5 table of the searchable text of each question (rowid = question id),
+# diacritics folded so that "reponse" finds "réponse"
+CREATE_INDEX = (
+    "CREATE VIRTUAL TABLE question_search USING fts5("
+    "title, text, answers, tokenize = 'unicode61 remove_diacritics 2')"
+)
+# Answer texts of a question, in answer order, one per line
+ANSWERS_OF = (
+    "(SELECT group_concat(text, char(10)) FROM "
+    "(SELECT text FROM answer WHERE question_id = {} ORDER BY \"order\", id))"
+)
+# The question rows are kept up to date by triggers, so every write path
+# (handlers, bulk import, bulk deletes) updates them in the same transaction.
+# The answers column is refreshed by index_answers() once the answers of a
+# question are written: with a trigger per answer, each answer would rewrite
+# the whole indexed row, making imports several times slower.
+TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS question_search_insert AFTER INSERT ON question BEGIN "
+    "INSERT INTO question_search (rowid, title, text, answers) "
+    f"VALUES (new.id, new.title, new.text, {ANSWERS_OF.format('new.id')}); END",
+    "CREATE TRIGGER IF NOT EXISTS question_search_update AFTER UPDATE OF title, text ON question BEGIN "
+    "UPDATE question_search SET title = new.title, text = new.text WHERE rowid = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS question_search_delete AFTER DELETE ON question BEGIN "
+    "DELETE FROM question_search WHERE rowid = old.id; END",
+)
+INDEX_ANSWERS = text(
+    f"UPDATE question_search SET answers = {ANSWERS_OF.format('question_search.rowid')} "
+    "WHERE rowid = :question_id"
+)
+INDEX_ALL_ANSWERS = text(
+    f"UPDATE question_search SET answers = {ANSWERS_OF.format('question_search.rowid')}"
+)
+# Answer.question_id is indexed (index=True), but create_all() does not add
+# an index to the answer table of an existing database
+ANSWER_QUESTION_INDEX = 'CREATE INDEX IF NOT EXISTS ix_answer_question_id ON answer (question_id)'
+INDEX_EXISTS = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'question_search'"
+FILL_INDEX = (
+    "INSERT INTO question_search (rowid, title, text, answers) "
+    f"SELECT id, title, text, {ANSWERS_OF.format('question.id')} FROM question"
+)
+
+# Delimit the matches in snippets until the text around them is HTML-escaped
+MATCH_START, MATCH_END = '\x02', '\x03'
+# Matches weigh 3 times more in the title than in the text or the answers
+SEARCH_QUERY = text(
+    "SELECT question.id, question.position, question.title, "
+    f"snippet(question_search, -1, char({ord(MATCH_START)}), char({ord(MATCH_END)}), '…', 16) AS snippet, "
+    "bm25(question_search, 3.0, 1.0, 1.0) AS rank "
+    "FROM question_search JOIN question ON question.id = question_search.rowid "
+    "WHERE question_search MATCH :query ORDER BY rank, question.id LIMIT :limit OFFSET :offset"
+)
+COUNT_QUERY = text("SELECT count(*) FROM question_search WHERE question_search MATCH :query")
+
+TERM = re.compile(r'\w+')
+
+
+def init_search(app):
+    # Whether question_search exists in the app's database, None until checked
+    app.extensions['search_index'] = None
+
+
+def _index_created(available):
+    if has_app_context():
+        current_app.extensions['search_index'] = available
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    """Create the index and its triggers with the tables (create_all), and
+    index the existing questions of a database created before it"""
+    if connection.dialect.name != 'sqlite':
+        return
+    # Indexing reads the answers of one question at a time
+    connection.exec_driver_sql(ANSWER_QUESTION_INDEX)
+    if not connection.exec_driver_sql(INDEX_EXISTS).first():
+        try:
+            connection.exec_driver_sql(CREATE_INDEX)
+        except OperationalError:
+            logger.warning("SQLite is built without FTS5, question search is disabled")
+            _index_created(False)
+            return
+        connection.exec_driver_sql(FILL_INDEX)
+    for trigger in TRIGGERS:
+        connection.exec_driver_sql(trigger)
+    _index_created(True)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(target, connection, **kw):
+    # The triggers go with their tables
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS question_search')
+
+
+def index_answers(question_ids=None):
+    """Index the current answers of some questions (all with None), in the
+    caller's transaction"""
+    if db.engine.dialect.name != 'sqlite':
+        return
+    index_available = current_app.extensions['search_index']
+    if index_available is None:
+        index_available = db.session.execute(text(INDEX_EXISTS)).first() is not None
+        current_app.extensions['search_index'] = index_available
+    if not index_available:
+        return
+    if question_ids is None:
+        db.session.execute(INDEX_ALL_ANSWERS)
+    elif question_ids:
+        db.session.execute(INDEX_ANSWERS, [{"question_id": question_id} for question_id in question_ids])
+
+
+def match_query(search):
+    """FTS5 query of free text: every word, as a prefix (so that results
+    come while typing), with FTS5 operators and punctuation taken literally.
+    None when there is no word to search."""
+    terms = TERM.findall(search)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def snippet_html(snippet):
+    """HTML of a snippet: the text escaped, the matched words between <mark> tags"""
+    return html.escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def search_questions(search, limit, offset=0):
+    """(page of matching questions, total matches), best matches first.
+
+    Each result has the question id, position and title, and a snippet of
+    the best matching column as HTML, with the matched words between <mark>
+    tags.
+    """
+    query = match_query(search)
+    if query is None:
+        return [], 0
+    rows = db.session.execute(SEARCH_QUERY, {"query": query, "limit": limit, "offset": offset}).all()
+    total = db.session.execute(COUNT_QUERY, {"query": query}).scalar()
+    return [
+        {
+            "id": row.id,
+            "position": row.position,
+            "title": row.title,
+            "snippet": snippet_html(row.snippet),
+            "score": round(-row.rank, 4)  # bm25() is lower for better matches
+        }
+        for row in rows
+    ], total
@@ -0,0 +1,136 @@
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from models import Question, question_load_options
+from quiz_state import get_quiz_version
+
+try:
+    import orjson
+except ImportError:  # Optional, the stdlib json module is used instead
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider using orjson when it is installed.
+
+    Calls with extra json.dumps/json.loads arguments, or without orjson,
+    go through Flask's default stdlib provider. Keys are sorted like with
+    the default provider (sort_keys).
+    """
+
+    # What jsonify() and the session serializer pass, orjson's output is compact
+    COMPACT = {'separators': (',', ':')}
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or (kwargs and kwargs != self.COMPACT):
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def dumps_bytes(self, obj):
+        if orjson is None:
+            return super().dumps(obj).encode()
+        # Datetimes keep Flask's HTTP date format through default()
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def dumps_bytes(obj):
+    """Serialize obj to JSON bytes with the app's provider"""
+    provider = current_app.json
+    if isinstance(provider, FastJSONProvider):
+        return provider.dumps_bytes(obj)
+    return provider.dumps(obj).encode()
+
+
+class QuestionFragments:
+    """Serialized to_dict() bytes of each question for one quiz version,
+    per requested image size"""
+
+    def __init__(self, version):
+        self.version = version
+        self.by_id = {}  # (question id, image size) -> bytes
+        self.id_by_position = {}
+        self.ordered_ids = None  # Set once every question of the quiz is cached
+
+    def add(self, question, image_size=None):
+        fragment = dumps_bytes(question.to_dict(image_size=image_size))
+        self.by_id[(question.id, image_size)] = fragment
+        self.id_by_position[question.position] = question.id
+        return fragment
+
+
+def init_question_fragments(app):
+    app.extensions['question_fragments'] = QuestionFragments(None)
+
+
+def _fragments_for(version):
+    """Fragments of a quiz version, all dropped when the quiz changes"""
+    fragments = current_app.extensions['question_fragments']
+    if fragments.version != version:
+        fragments = current_app.extensions['question_fragments'] = QuestionFragments(version)
+    return fragments
+
+
+def _current_fragments():
+    return _fragments_for(get_quiz_version())
+
+
+def peek_question_json(version, question_id=None, position=None, image_size=None):
+    """Cached JSON bytes of a question by id or position, or None if not
+    cached for this quiz version (never touches the database)"""
+    fragments = current_app.extensions['question_fragments']
+    if fragments.version != version:
+        return None
+    if question_id is None:
+        question_id = fragments.id_by_position.get(position)
+    return fragments.by_id.get((question_id, image_size))
+
+
+def add_question_json(version, question, image_size=None):
+    """Cache and return the JSON bytes of a question loaded by another code path"""
+    return _fragments_for(version).add(question, image_size)
+
+
+def question_json_by_id(question_id, image_size=None):
+    """JSON bytes of a question, or None if it does not exist"""
+    fragments = _current_fragments()
+    fragment = fragments.by_id.get((question_id, image_size))
+    if fragment is None:
+        question = Question.query.options(*question_load_options()).filter_by(id=question_id).first()
+        if question is None:
+            return None
+        fragment = fragments.add(question, image_size)
+    return fragment
+
+
+def question_json_by_position(position, image_size=None):
+    """JSON bytes of the question at a position, or None if there is none"""
+    fragments = _current_fragments()
+    question_id = fragments.id_by_position.get(position)
+    if question_id is not None:
+        fragment = fragments.by_id.get((question_id, image_size))
+        if fragment is not None:
+            return fragment
+    question = Question.query.options(*question_load_options()).filter_by(position=position).first()
+    if question is None:
+        return None
+    return fragments.add(question, image_size)
+
+
+def all_questions_json():
+    """JSON bytes of {"questions": [...]} built by concatenating cached fragments"""
+    fragments = _current_fragments()
+    ordered_ids = fragments.ordered_ids
+    if ordered_ids is None:
+        questions = Question.query.options(*question_load_options()).order_by(Question.position).all()
+        for question in questions:
+            if (question.id, None) not in fragments.by_id:
+                fragments.add(question)
+        ordered_ids = fragments.ordered_ids = [question.id for question in questions]
+    return b'{"questions":[' + b','.join(fragments.by_id[(i, None)] for i in ordered_ids) + b']}'
@@ -0,0 +1,164 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+SNAPSHOT_NAME = re.compile(r'[A-Za-z0-9_-]{1,64}')
+STORAGES = ('disk', 'memory')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class SnapshotStore:
+    """Named copies of the SQLite database, made and restored with SQLite's
+    online backup API.
+
+    Disk snapshots are files in `directory`, shared by every worker process;
+    memory snapshots are in-memory databases of this process only. Either
+    is copied page by page, without going through SQLAlchemy, so resetting
+    a large fixture takes milliseconds where rebuilding it takes a request
+    per question.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._memory = {}  # name -> (in-memory connection, created at)
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, f'{name}.db')
+
+    def _check_name(self, name):
+        if not SNAPSHOT_NAME.fullmatch(name):
+            raise SnapshotError("Snapshot names are 1 to 64 letters, digits, '-' or '_'")
+
+    def list(self):
+        snapshots = []
+        with self._lock:
+            for name, (connection, created_at) in self._memory.items():
+                page_count = connection.execute('PRAGMA page_count').fetchone()[0]
+                page_size = connection.execute('PRAGMA page_size').fetchone()[0]
+                snapshots.append({"name": name, "storage": "memory", "size": page_count * page_size,
+                                  "createdAt": created_at.isoformat() + 'Z'})
+        if os.path.isdir(self.directory):
+            for file_name in os.listdir(self.directory):
+                name, extension = os.path.splitext(file_name)
+                if extension == '.db' and SNAPSHOT_NAME.fullmatch(name):
+                    stat = os.stat(os.path.join(self.directory, file_name))
+                    snapshots.append({"name": name, "storage": "disk", "size": stat.st_size,
+                                      "createdAt": datetime.utcfromtimestamp(stat.st_mtime).isoformat() + 'Z'})
+        return sorted(snapshots, key=lambda snapshot: snapshot["name"])
+
+    def create(self, name, live, storage='disk'):
+        """Copy the `live` sqlite3 connection's database into snapshot `name`, replacing it"""
+        self._check_name(name)
+        if storage not in STORAGES:
+            raise SnapshotError(f"storage must be one of {', '.join(STORAGES)}")
+        if storage == 'memory':
+            connection = sqlite3.connect(':memory:', check_same_thread=False)
+            live.backup(connection)
+            with self._lock:
+                previous = self._memory.pop(name, None)
+                self._memory[name] = (connection, datetime.utcnow())
+            if previous is not None:
+                previous[0].close()
+            self._delete_file(name)
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            temporary_path = self._path(name) + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+            connection = sqlite3.connect(temporary_path)
+            try:
+                live.backup(connection)
+                # A self-contained file, without -wal/-shm companions
+                connection.execute('PRAGMA journal_mode=DELETE')
+            finally:
+                connection.close()
+            os.replace(temporary_path, self._path(name))
+            self._delete_memory(name)
+
+    def restore(self, name, live, prepare=None):
+        """Replace the `live` database with snapshot `name`, in one step.
+
+        The snapshot is first copied to a staging in-memory database, where
+        `prepare(staging connection)` can adjust it; the staging copy then
+        replaces the live database in a single backup step, so other
+        connections see either the old or the restored database.
+        """
+        self._check_name(name)
+        staging = sqlite3.connect(':memory:')
+        try:
+            with self._lock:
+                memory = self._memory.get(name)
+                if memory is not None:
+                    memory[0].backup(staging)
+            if memory is None:
+                if not os.path.exists(self._path(name)):
+                    raise KeyError(name)
+                source = sqlite3.connect(f'file:{self._path(name)}?mode=ro', uri=True)
+                try:
+                    source.backup(staging)
+                finally:
+                    source.close()
+            if prepare is not None:
+                prepare(staging)
+                staging.commit()
+            staging.backup(live)
+        finally:
+            staging.close()
+
+    def delete(self, name):
+        self._check_name(name)
+        if not (self._delete_memory(name) | self._delete_file(name)):
+            raise KeyError(name)
+
+    def _delete_memory(self, name):
+        with self._lock:
+            previous = self._memory.pop(name, None)
+        if previous is not None:
+            previous[0].close()
+        return previous is not None
+
+    def _delete_file(self, name):
+        try:
+            os.remove(self._path(name))
+            return True
+        except FileNotFoundError:
+            return False
+
+
+def init_snapshots(app):
+    app.extensions['snapshots'] = SnapshotStore(app.config['SNAPSHOT_PATH'])
+
+
+def restore_snapshot(store, name, live):
+    """Restore snapshot `name` over the `live` database, keeping its live state.
+
+    The quiz version goes on from the live one (so no ETag or cache of any
+    worker can mistake the restored quiz for one it has seen), and the admin
+    sessions are the live ones (so a logged out token stays revoked).
+    Returns the new quiz version.
+    """
+    row = live.execute('SELECT version FROM quiz_state WHERE id = 1').fetchone()
+    live_version = row[0] if row else 0
+    sessions = live.execute('SELECT id, token, created_at, expires_at, revoked FROM admin_session').fetchall()
+    live.commit()  # End the read transaction, the backup needs the database to itself
+    restored = {}
+
+    def keep_live_state(staging):
+        row = staging.execute('SELECT version FROM quiz_state WHERE id = 1').fetchone()
+        restored["version"] = max(live_version, row[0] if row else 0) + 1
+        staging.execute(
+            'INSERT INTO quiz_state (id, version) VALUES (1, ?) '
+            'ON CONFLICT (id) DO UPDATE SET version = excluded.version', (restored["version"],)
+        )
+        staging.execute('DELETE FROM admin_session')
+        staging.executemany(
+            'INSERT INTO admin_session (id, token, created_at, expires_at, revoked) VALUES (?, ?, ?, ?, ?)',
+            sessions
+        )
+
+    store.restore(name, live, prepare=keep_live_state)
+    return restored["version"]
@@ -0,0 +1,106 @@
+from collections import Counter
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import selectinload
+from models import db, Question, QuizLayout, AnswerChoiceCount
+
+
+def pack_choices(answers):
+    """One byte per question: the chosen answer position, 0 when it is not
+    a position (missing, out of range or not an integer)"""
+    return bytes(a if type(a) is int and 0 < a < 256 else 0 for a in answers)
+
+
+def layout_id(answer_key):
+    """Id of the QuizLayout of an answer key's question order, created if needed.
+
+    Resolved once per answer key; the layout row is committed on its own,
+    before any participation refers to it.
+    """
+    if answer_key.layout_id is None:
+        question_ids = ','.join(map(str, answer_key.question_ids))
+        # Several requests or workers may create the same layout at once
+        db.session.execute(
+            sqlite_insert(QuizLayout).values(question_ids=question_ids).on_conflict_do_nothing()
+        )
+        db.session.commit()
+        answer_key.layout_id = db.session.query(QuizLayout.id).filter_by(question_ids=question_ids).scalar()
+    return answer_key.layout_id
+
+
+def record_choices(submissions):
+    """Add (question ids, packed choices) submissions to the choice counters.
+
+    Runs in the caller's transaction, so the counters are committed with
+    the participations: one upsert per (question, position) of the batch.
+    """
+    counts = Counter()
+    for question_ids, choices in submissions:
+        counts.update(zip(question_ids, choices))
+    record_choice_counts(counts)
+
+
+def record_choice_counts(counts):
+    """Add {(question id, position): count} to the choice counters, in the caller's transaction"""
+    if not counts:
+        return
+    statement = sqlite_insert(AnswerChoiceCount)
+    statement = statement.on_conflict_do_update(
+        index_elements=[AnswerChoiceCount.question_id, AnswerChoiceCount.position],
+        set_={'choices': AnswerChoiceCount.choices + statement.excluded.choices}
+    )
+    db.session.execute(statement, [
+        {"question_id": question_id, "position": position, "choices": count}
+        for (question_id, position), count in counts.items()
+    ])
+
+
+def layout_question_ids(layout):
+    """Question ids of a QuizLayout, in quiz order"""
+    return [int(question_id) for question_id in layout.question_ids.split(',') if question_id]
+
+
+def question_stats():
+    """Choice counts of each question and answer, in quiz order.
+
+    Reads the questions and the counters only, never the participations.
+    The correct rate is computed against the current correct answer, so it
+    follows the admin's corrections.
+    """
+    questions = Question.query.options(selectinload(Question.answers)).order_by(Question.position).all()
+    counts = {}
+    for row in AnswerChoiceCount.query.all():
+        counts.setdefault(row.question_id, {})[row.position] = row.choices
+    stats = []
+    for question in questions:
+        question_counts = counts.get(question.id, {})
+        total = sum(question_counts.values())
+        answers = []
+        correct = None
+        for position, answer in enumerate(question.answers, start=1):
+            choices = question_counts.get(position, 0)
+            if answer.is_correct and correct is None:
+                correct = choices
+            answers.append({
+                "position": position,
+                "text": answer.text,
+                "isCorrect": answer.is_correct,
+                "choices": choices
+            })
+        stats.append({
+            "id": question.id,
+            "position": question.position,
+            "title": question.title,
+            "participations": total,
+            "unanswered": question_counts.get(0, 0),
+            "correctRate": round(correct / total, 4) if total and correct is not None else None,
+            "answers": answers
+        })
+    return stats
+
+
+def delete_choice_counts(question_id=None):
+    """Drop the counters of a question, or of all questions"""
+    query = AnswerChoiceCount.query
+    if question_id is not None:
+        query = query.filter_by(question_id=question_id)
+    query.delete(synchronize_session=False)
@@ -0,0 +1,1108 @@
+"""
+Tests de l'API Quiz via le client de test Flask (pas de serveur nécessaire)
+"""
+import base64
+import gzip
+import hashlib
+import json
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from models import db, Participation
+
+
+def make_question(position, correct=1, title="Question"):
+    return {
+        "title": f"{title} {position}",
+        "text": f"Texte de la question {position} ?",
+        "image": "falseb64imagecontent",
+        "position": position,
+        "possibleAnswers": [
+            {"text": f"Réponse {i}", "isCorrect": i == correct} for i in range(1, 5)
+        ]
+    }
+
+
+def add_questions(client, headers, correct_positions):
+    ids = []
+    for i, correct in enumerate(correct_positions):
+        response = client.post('/questions', json=make_question(i + 1, correct), headers=headers)
+        assert response.status_code == 200
+        ids.append(response.get_json()['id'])
+    return ids
+
+
+def test_participation_is_graded(client, auth_headers):
+    add_questions(client, auth_headers, [2, 4, 1])
+
+    response = client.post('/participations', json={"playerName": "Anton", "answers": [2, 3, 1]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["score"] == 2
+    assert [s["correctAnswerPosition"] for s in data["answersSummaries"]] == [2, 4, 1]
+    assert [s["wasCorrect"] for s in data["answersSummaries"]] == [True, False, True]
+
+
+def test_participation_wrong_answer_count(client, auth_headers):
+    add_questions(client, auth_headers, [2, 4])
+
+    response = client.post('/participations', json={"playerName": "Bruno", "answers": [2]})
+    assert response.status_code == 400
+
+
+def test_answer_key_follows_question_updates(client, auth_headers):
+    ids = add_questions(client, auth_headers, [2, 4])
+    assert client.post('/participations', json={"answers": [2, 4]}).get_json()["score"] == 2
+
+    response = client.put(f'/questions/{ids[0]}', json=make_question(1, correct=3), headers=auth_headers)
+    assert response.status_code == 204
+    assert client.post('/participations', json={"answers": [2, 4]}).get_json()["score"] == 1
+
+    client.delete(f'/questions/{ids[1]}', headers=auth_headers)
+    assert client.post('/participations', json={"answers": [3]}).get_json()["score"] == 1
+
+
+def test_quiz_info_leaderboard(client, auth_headers):
+    add_questions(client, auth_headers, [1, 1, 1])
+    client.delete('/participations/all', headers=auth_headers)
+
+    submissions = [("Anton", [1, 2, 2]), ("Bruno", [1, 1, 1]), ("Caesar", [2, 2, 2]), ("Dora", [1, 1, 2])]
+    submissions += [(f"Player {i}", [1, 2, 2]) for i in range(10)]
+    for name, answers in submissions:
+        client.post('/participations', json={"playerName": name, "answers": answers})
+
+    data = client.get('/quiz-info').get_json()
+    assert data["size"] == 3
+    assert [s["score"] for s in data["scores"]] == [3, 2] + [1] * 8
+    assert data["scores"][0]["playerName"] == "Bruno"
+    # Ties are ordered by most recent first
+    assert data["scores"][2]["playerName"] == "Player 9"
+
+    client.delete('/participations/all', headers=auth_headers)
+    assert client.get('/quiz-info').get_json()["scores"] == []
+
+
+def test_rank_on_submission(client, auth_headers):
+    add_questions(client, auth_headers, [1, 1, 1])
+    ranks = [client.post('/participations', json={"playerName": name, "answers": answers}).get_json()
+             for name, answers in [("Anton", [1, 2, 2]), ("Bruno", [1, 1, 1]), ("Caesar", [2, 2, 2]),
+                                   ("Dora", [1, 2, 2])]]
+    assert [(r["score"], r["rank"], r["percentile"]) for r in ranks] == [
+        (1, 1, 0.0), (3, 1, 50.0), (0, 3, 0.0), (1, 2, 25.0)
+    ]
+
+    response = client.get('/participations/rank?score=2')
+    assert query_count(response) == 0
+    assert response.get_json() == {"score": 2, "rank": 2, "percentile": 75.0, "participations": 4}
+    assert client.get('/participations/rank?score=10').get_json()["rank"] == 1
+    assert client.get('/participations/rank?score=-1').status_code == 400
+    assert client.get('/participations/rank').status_code == 400
+
+    client.delete('/participations/all', headers=auth_headers)
+    assert client.get('/participations/rank?score=0').get_json() == {
+        "score": 0, "rank": 1, "percentile": None, "participations": 0
+    }
+
+
+def query_count(response):
+    return int(response.headers['X-Query-Count'])
+
+
+def test_question_reads_query_budget(client, auth_headers):
+    # The number of statements must not grow with the number of questions
+    ids = add_questions(client, auth_headers, [1, 2, 3, 4] * 5)
+
+    response = client.get('/questions/all', headers=auth_headers)
+    assert len(response.get_json()["questions"]) == 20
+    assert query_count(response) <= 2
+    assert query_count(client.get('/questions?position=3')) <= 2
+    assert query_count(client.get(f'/questions/{ids[5]}')) <= 2
+
+    client.post('/participations', json={"answers": [1] * 20})
+    # The participation and one upsert of the choice counters
+    assert query_count(client.post('/participations', json={"answers": [1] * 20})) <= 2
+
+
+def test_question_stats_from_choice_counters(client, auth_headers, monkeypatch):
+    import app as app_module
+    from batching import ParticipationBatcher
+    ids = add_questions(client, auth_headers, [1, 2, 3])
+    client.delete('/participations/all', headers=auth_headers)
+    for answers in ([1, 2, 3], [1, 1, 1], [2, 2, "x"]):
+        client.post('/participations', json={"playerName": "Direct", "answers": answers})
+    # Group-committed participations update the counters in their batch
+    batcher = ParticipationBatcher(app_module.app, flush_interval=0.001)
+    monkeypatch.setitem(app_module.app.extensions, 'participation_batcher', batcher)
+    client.post('/participations', json={"playerName": "Batched", "answers": [1, 3, 3]})
+    batcher.stop()
+
+    participation = Participation.query.filter_by(player_name="Batched").one()
+    assert participation.choices == bytes([1, 3, 3])
+
+    response = client.get('/questions/stats', headers=auth_headers)
+    assert response.status_code == 200
+    assert query_count(response) <= 3  # Token check, questions, counters
+    stats = response.get_json()["questions"]
+    assert [q["id"] for q in stats] == ids
+    assert [a["choices"] for a in stats[0]["answers"]] == [3, 1, 0, 0]
+    assert [q["participations"] for q in stats] == [4, 4, 4]
+    assert stats[2]["unanswered"] == 1
+    assert [q["correctRate"] for q in stats] == [0.75, 0.5, 0.5]
+
+    hardest = client.get('/questions/stats?sort=correctRate', headers=auth_headers).get_json()["questions"]
+    assert hardest[0]["correctRate"] == 0.5
+    assert client.get('/questions/stats').status_code == 401
+
+    client.delete(f'/questions/{ids[0]}', headers=auth_headers)
+    client.delete('/participations/all', headers=auth_headers)
+    assert all(q["participations"] == 0 for q in
+               client.get('/questions/stats', headers=auth_headers).get_json()["questions"])
+
+
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_regrade_after_answer_key_fix(client, auth_headers, monkeypatch, vectorized):
+    import app as app_module
+    import batch_grading
+    from datetime import datetime
+    if vectorized:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(batch_grading, 'np', None)
+    monkeypatch.setattr(batch_grading, 'CHUNK_SIZE', 2)
+    ids = add_questions(client, auth_headers, [1, 2, 3])
+    for name, answers in [("Anton", [1, 2, 3]), ("Bruno", [1, 4, 3]), ("Caesar", [2, 4, 1])]:
+        client.post('/participations', json={"playerName": name, "answers": answers})
+    # Recorded before choices were stored: kept as is
+    with app_module.app.app_context():
+        db.session.add(Participation(player_name="Legacy", score=2, created_at=datetime.utcnow()))
+        db.session.commit()
+    assert client.get('/participations/rank?score=3').get_json()["rank"] == 1
+    # Score index of another worker, loaded before the regrade
+    from ranking import ScoreIndex
+    other_worker = ScoreIndex()
+    with app_module.app.app_context():
+        assert other_worker.rank(0)[0] == 4
+
+    # The second question's correct answer was the fourth one
+    client.put(f'/questions/{ids[1]}', json=make_question(2, correct=4), headers=auth_headers)
+    etag = client.get('/questions?position=1').headers['ETag']
+    response = client.post('/participations/regrade', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json() == {"participations": 4, "updated": 3, "skipped": 1}
+    # The questions did not change, their cached copies stay valid
+    assert client.get('/questions?position=1').headers['ETag'] == etag
+    monkeypatch.setitem(app_module.app.config, 'CACHE_REVALIDATE_SECONDS', 0.001)
+    time.sleep(0.01)
+    with app_module.app.app_context():
+        assert other_worker.rank(0)[0] == 5  # Caesar now scores 1
+    monkeypatch.setitem(app_module.app.config, 'CACHE_REVALIDATE_SECONDS', 0)
+
+    scores = {p["playerName"]: p["score"] for p in client.get('/quiz-info').get_json()["scores"]}
+    assert scores == {"Anton": 2, "Bruno": 3, "Caesar": 1, "Legacy": 2}
+    assert client.get('/participations/rank?score=3').get_json() == {
+        "score": 3, "rank": 1, "percentile": 75.0, "participations": 4
+    }
+    # Nothing left to change
+    assert client.post('/participations/regrade', headers=auth_headers).get_json()["updated"] == 0
+    assert client.post('/participations/regrade').status_code == 401
+
+
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_batch_grading(client, auth_headers, monkeypatch, vectorized):
+    import batch_grading
+    if vectorized:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(batch_grading, 'np', None)
+    ids = add_questions(client, auth_headers, [1, 2, 3])
+    client.delete('/participations/all', headers=auth_headers)
+    batch = {"participations": [
+        {"playerName": "A", "answers": [1, 2, 3]},
+        {"playerName": "B", "answers": [1, 1, 1]},
+        {"playerName": "C", "answers": [4, 999, 3]},
+    ]}
+
+    dry_run = client.post('/participations/batch', json={**batch, "save": False}, headers=auth_headers)
+    assert dry_run.get_json() == {"scores": [3, 1, 1], "saved": 0}
+    assert client.get('/quiz-info').get_json()["scores"] == []
+
+    response = client.post('/participations/batch', json=batch, headers=auth_headers)
+    assert response.get_json() == {"scores": [3, 1, 1], "saved": 3}
+    # Mixed values are packed like single submissions
+    mixed = {"participations": [{"playerName": "D", "answers": [1, "x", None]}]}
+    assert client.post('/participations/batch', json=mixed, headers=auth_headers).get_json()["scores"] == [1]
+
+    assert [s["score"] for s in client.get('/quiz-info').get_json()["scores"]] == [3, 1, 1, 1]
+    assert Participation.query.filter_by(player_name="C").one().choices == bytes([4, 0, 3])
+    stats = client.get('/questions/stats', headers=auth_headers).get_json()["questions"]
+    assert [a["choices"] for a in stats[0]["answers"]] == [3, 0, 0, 1]
+    assert stats[1]["unanswered"] == 2
+    assert stats[0]["id"] == ids[0]
+
+    bad = {"participations": [{"answers": [1, 2, 3]}, {"answers": [1]}]}
+    response = client.post('/participations/batch', json=bad, headers=auth_headers)
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Participation 1:")
+    assert client.post('/participations/batch', json={"participations": []}, headers=auth_headers).status_code == 400
+
+
+def test_question_search(client, auth_headers):
+    ids = add_questions(client, auth_headers, [1, 1, 1])
+    question = make_question(2)
+    question["title"] = "Capitale de la France"
+    question["possibleAnswers"][0]["text"] = "Paris"
+    client.put(f'/questions/{ids[1]}', json=question, headers=auth_headers)
+    question = make_question(3)
+    question["text"] = "Où se trouve la capitale du <b>Japon</b> ? <script>alert(1)</script>"
+    client.put(f'/questions/{ids[2]}', json=question, headers=auth_headers)
+
+    def search(query, **params):
+        response = client.get('/questions/search', query_string={"q": query, **params}, headers=auth_headers)
+        assert response.status_code == 200
+        return response.get_json()
+
+    # A title match ranks first
+    data = search("capitale")
+    assert [q["id"] for q in data["questions"]] == [ids[1], ids[2]]
+    assert "<mark>Capitale</mark>" in data["questions"][0]["snippet"]
+    # Only the <mark> tags are HTML, the question text is escaped
+    snippet = search("japon")["questions"][0]["snippet"]
+    assert "&lt;b&gt;<mark>Japon</mark>&lt;/b&gt;" in snippet and "&lt;script&gt;" in snippet
+    assert search("pari")["questions"][0]["id"] == ids[1]
+    # Accents ignored, prefixes matched
+    assert search("reponse")["total"] == 3
+
+    page = search("question", limit=2)
+    assert len(page["questions"]) == 2 and page["total"] == 3 and page["nextOffset"] == 2
+    last_page = search("question", limit=2, offset=2)
+    assert len(last_page["questions"]) == 1 and last_page["nextOffset"] is None
+
+    client.delete(f'/questions/{ids[1]}', headers=auth_headers)
+    assert search("paris")["total"] == 0
+    assert search('"* OR (')["total"] == 0
+    assert client.get('/questions/search', headers=auth_headers).status_code == 400
+
+
+def test_answers_are_returned_in_order(client, auth_headers):
+    ids = add_questions(client, auth_headers, [3])
+    answers = client.get(f'/questions/{ids[0]}').get_json()["possibleAnswers"]
+    assert [a["text"] for a in answers] == ["Réponse 1", "Réponse 2", "Réponse 3", "Réponse 4"]
+    assert [a["isCorrect"] for a in answers] == [False, False, True, False]
+
+
+PNG_BYTES = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+PNG_DATA_URL = 'data:image/png;base64,' + base64.b64encode(PNG_BYTES).decode()
+
+
+def test_images_are_stored_by_hash(client, auth_headers):
+    payload = make_question(1)
+    payload["image"] = PNG_DATA_URL
+    question_id = client.post('/questions', json=payload, headers=auth_headers).get_json()['id']
+
+    image_url = client.get(f'/questions/{question_id}').get_json()["image"]
+    assert image_url == '/images/' + hashlib.sha256(PNG_BYTES).hexdigest()
+
+    response = client.get(image_url)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.data == PNG_BYTES
+    assert 'immutable' in response.headers['Cache-Control']
+    response.close()
+
+    # Identical uploads share the stored file, URLs sent back are kept as references
+    payload = make_question(2)
+    payload["image"] = PNG_DATA_URL
+    other_id = client.post('/questions', json=payload, headers=auth_headers).get_json()['id']
+    assert client.get(f'/questions/{other_id}').get_json()["image"] == image_url
+    payload["image"] = 'http://localhost:5000' + image_url
+    client.put(f'/questions/{other_id}', json=payload, headers=auth_headers)
+    assert client.get(f'/questions/{other_id}').get_json()["image"] == image_url
+
+    assert client.get('/images/' + '0' * 64).status_code == 404
+
+
+def test_image_variant_falls_back_to_original(client, auth_headers):
+    payload = make_question(1)
+    payload["image"] = PNG_DATA_URL
+    client.post('/questions', json=payload, headers=auth_headers)
+    image_hash = hashlib.sha256(PNG_BYTES).hexdigest()
+
+    # A 1x1 PNG gets no smaller variant, the original stands in without being cached for good
+    response = client.get(f'/images/{image_hash}?size=thumbnail')
+    assert response.data == PNG_BYTES
+    assert response.headers['Cache-Control'] == 'no-cache'
+    response.close()
+    assert client.get(f'/images/{image_hash}?size=huge').status_code == 400
+    assert client.get('/questions?position=1&size=huge').status_code == 400
+
+
+def test_image_variants_are_processed_in_background(client, auth_headers):
+    pytest.importorskip('PIL')
+    import io
+    from PIL import Image, PngImagePlugin
+    import app as app_module
+
+    original = Image.linear_gradient('L').resize((1600, 1200)).convert('RGB')
+    metadata = PngImagePlugin.PngInfo()
+    metadata.add_text('Comment', 'x' * 1000)
+    buffer = io.BytesIO()
+    original.save(buffer, 'PNG', pnginfo=metadata)
+    payload = make_question(1)
+    payload["image"] = 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+    question_id = client.post('/questions', json=payload, headers=auth_headers).get_json()['id']
+    app_module.app.extensions['image_processor'].stop()  # Waits for the queued jobs
+
+    response = client.get(f'/questions/{question_id}?size=display')
+    image_url = response.get_json()["image"]
+    assert image_url.endswith('?size=display')
+    assert response.headers['ETag'] != client.get(f'/questions/{question_id}').headers['ETag']
+
+    for size, longest_side in (('display', 800), ('thumbnail', 160)):
+        response = client.get(image_url.replace('display', size))
+        assert 'immutable' in response.headers['Cache-Control']
+        assert len(response.data) < len(buffer.getvalue())
+        variant = Image.open(io.BytesIO(response.data))
+        assert max(variant.size) == longest_side
+        assert 'Comment' not in variant.info
+        response.close()
+
+
+def test_invalid_image_is_rejected(client, auth_headers):
+    payload = make_question(1)
+    payload["image"] = 'data:image/bmp;base64,AAAA'
+    assert client.post('/questions', json=payload, headers=auth_headers).status_code == 400
+    # Declared as PNG but not an image
+    payload["image"] = 'data:image/png;base64,' + base64.b64encode(b'<script>alert(1)</script>').decode()
+    assert client.post('/questions', json=payload, headers=auth_headers).status_code == 400
+    # Characters outside the base64 alphabet
+    payload["image"] = PNG_DATA_URL[:40] + '!!!!' + PNG_DATA_URL[44:]
+    assert client.post('/questions', json=payload, headers=auth_headers).status_code == 400
+
+
+def test_image_checked_without_full_decode(monkeypatch):
+    import app as app_module
+    import validation
+    from validation import decode_base64_image, get_image_size_bytes, validate_base64_image
+    oversized = 'data:image/png;base64,' + 'A' * (2 * 1024 * 1024)
+    with app_module.app.app_context():
+        assert get_image_size_bytes(PNG_DATA_URL) == len(PNG_BYTES)
+
+        monkeypatch.setattr(validation, 'decode_base64_chunked', None)  # Must not be reached
+        assert not validate_base64_image(oversized)[0]
+        assert validate_base64_image(PNG_DATA_URL) == (True, None)
+        monkeypatch.undo()
+
+        # The real format wins over the declared one
+        image_data, image_type, _ = decode_base64_image(PNG_DATA_URL.replace('image/png', 'image/jpeg'))
+        assert (bytes(image_data), image_type) == (PNG_BYTES, 'png')
+
+
+def test_question_reads_answer_not_modified(client, auth_headers):
+    ids = add_questions(client, auth_headers, [1, 2])
+
+    response = client.get('/questions?position=1')
+    etag = response.headers['ETag']
+    cached = client.get('/questions?position=1', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert query_count(cached) == 0
+    assert client.get(f'/questions/{ids[1]}', headers={'If-None-Match': etag}).status_code == 304
+
+    # Any admin mutation bumps the quiz version
+    client.put(f'/questions/{ids[0]}', json=make_question(1, title="Modifiée"), headers=auth_headers)
+    response = client.get('/questions?position=1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_quiz_info_etag_follows_scores(client, auth_headers):
+    add_questions(client, auth_headers, [1])
+    etag = client.get('/quiz-info').headers['ETag']
+    assert client.get('/quiz-info', headers={'If-None-Match': etag}).status_code == 304
+
+    client.post('/participations', json={"playerName": "Emil", "answers": [1]})
+    response = client.get('/quiz-info', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()["scores"][0]["playerName"] == "Emil"
+
+
+def test_participations_group_commit(client, auth_headers, monkeypatch):
+    import app as app_module
+    from batching import ParticipationBatcher
+
+    add_questions(client, auth_headers, [1, 2])
+    batcher = ParticipationBatcher(app_module.app, flush_interval=0.05, max_batch_size=8)
+    monkeypatch.setitem(app_module.app.extensions, 'participation_batcher', batcher)
+
+    def submit(i):
+        with app_module.app.test_client() as c:
+            return c.post('/participations', json={"playerName": f"P{i}", "answers": [1, i % 2 + 1]})
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        responses = list(executor.map(submit, range(20)))
+    batcher.stop()
+
+    assert all(r.status_code == 200 for r in responses)
+    stats = client.get('/participations/batching', headers=auth_headers).get_json()
+    assert stats["rows"] == 20
+    assert stats["batches"] < 20
+    assert stats["maxBatchSize"] <= 8
+    with app_module.app.app_context():
+        assert Participation.query.count() == 20
+
+
+def test_group_commit_timeouts(client, auth_headers, monkeypatch):
+    import app as app_module
+    from batching import ParticipationBatcher
+    add_questions(client, auth_headers, [1])
+    batcher = ParticipationBatcher(app_module.app, flush_interval=0.001, wait_timeout=0.05)
+    monkeypatch.setitem(app_module.app.extensions, 'participation_batcher', batcher)
+
+    # Still queued when the request gives up: withdrawn, so it can be retried
+    batcher._start = lambda: None
+    response = client.post('/participations', json={"playerName": "Queued", "answers": [1]})
+    assert response.status_code == 503
+    assert batcher.stats()["queued"] == 0
+    del batcher._start
+
+    # Already being written: accepted, and recorded in memory once committed
+    flush = batcher._flush
+
+    def slow_flush(batch):
+        time.sleep(0.2)
+        flush(batch)
+    monkeypatch.setattr(batcher, '_flush', slow_flush)
+    response = client.post('/participations', json={"playerName": "Slow", "answers": [1]})
+    assert response.status_code == 202
+    assert response.get_json()["pending"] is True and response.get_json()["score"] == 1
+    batcher.stop()
+
+    assert [s["playerName"] for s in client.get('/quiz-info').get_json()["scores"]] == ["Slow"]
+    assert client.get('/participations/rank?score=1').get_json()["participations"] == 1
+    with app_module.app.app_context():
+        assert [p.player_name for p in Participation.query.all()] == ["Slow"]
+
+
+def titles_by_position(client, headers):
+    questions = client.get('/questions/all', headers=headers).get_json()["questions"]
+    return [q["title"] for q in questions], [q["position"] for q in questions]
+
+
+def test_reordering_questions(client, auth_headers):
+    ids = add_questions(client, auth_headers, [1, 1, 1])
+    client.post('/questions', json=make_question(2, title="Insérée"), headers=auth_headers)
+    titles, positions = titles_by_position(client, auth_headers)
+    assert titles == ["Question 1", "Insérée 2", "Question 2", "Question 3"]
+    assert positions == [1, 2, 3, 4]
+
+    client.put(f'/questions/{ids[2]}', json={"position": 1}, headers=auth_headers)
+    assert titles_by_position(client, auth_headers)[0] == ["Question 3", "Question 1", "Insérée 2", "Question 2"]
+
+    client.put(f'/questions/{ids[0]}', json={"position": 4}, headers=auth_headers)
+    assert titles_by_position(client, auth_headers)[0] == ["Question 3", "Insérée 2", "Question 2", "Question 1"]
+
+    client.delete(f'/questions/{ids[1]}', headers=auth_headers)
+    titles, positions = titles_by_position(client, auth_headers)
+    assert titles == ["Question 3", "Insérée 2", "Question 1"]
+    assert positions == [1, 2, 3]
+
+
+def test_reordering_with_a_negative_position(client, auth_headers):
+    ids = add_questions(client, auth_headers, [1, 1, 1])
+    response = client.post('/questions', json=make_question(-1, title="Négative"), headers=auth_headers)
+    assert response.status_code == 200
+    response = client.post('/questions', json=make_question(2, title="Insérée"), headers=auth_headers)
+    assert response.status_code == 200
+    titles, positions = titles_by_position(client, auth_headers)
+    assert titles == ["Négative -1", "Question 1", "Insérée 2", "Question 2", "Question 3"]
+    assert positions == [-1, 1, 2, 3, 4]
+
+    assert client.put(f'/questions/{ids[2]}', json={"position": 1}, headers=auth_headers).status_code == 204
+    assert client.delete(f'/questions/{ids[0]}', headers=auth_headers).status_code == 204
+    titles, positions = titles_by_position(client, auth_headers)
+    assert titles == ["Négative -1", "Question 3", "Insérée 2", "Question 2"]
+    assert positions == [-1, 1, 2, 3]
+
+
+def test_reordering_query_budget(client, auth_headers):
+    # Moving, inserting or deleting costs the same number of statements whatever the quiz size
+    budgets = []
+    for size in (3, 30):
+        ids = add_questions(client, auth_headers, [1] * size)
+        budgets.append((
+            query_count(client.put(f'/questions/{ids[0]}', json={"position": size}, headers=auth_headers)),
+            query_count(client.post('/questions', json=make_question(1), headers=auth_headers)),
+            query_count(client.delete(f'/questions/{ids[1]}', headers=auth_headers)),
+        ))
+        client.delete('/questions/all', headers=auth_headers)
+    assert budgets[0] == budgets[1]
+
+
+def test_bulk_import_and_export(client, auth_headers):
+    add_questions(client, auth_headers, [1])
+    lines = [json.dumps(make_question(None, correct=i % 4 + 1, title="Importée")) for i in range(1200)]
+    response = client.post('/questions/import', data='\n'.join(lines) + '\n', headers=auth_headers,
+                           content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == 1200
+    assert client.get('/quiz-info').get_json()["size"] == 1201
+
+    response = client.get('/questions/export', headers=auth_headers)
+    assert response.mimetype == 'application/x-ndjson'
+    exported = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [q["position"] for q in exported] == list(range(1, 1202))
+    assert exported[1]["title"] == "Importée None"
+    assert [a["isCorrect"] for a in exported[2]["possibleAnswers"]] == [False, True, False, False]
+
+    # Re-importing the export replaces the quiz with an identical one
+    client.post('/participations', json={"playerName": "Avant", "answers": [1] * 1201})
+    response = client.post('/questions/import?replace=true', data=response.get_data(), headers=auth_headers)
+    assert response.get_json()["imported"] == 1201
+    assert client.get('/quiz-info').get_json()["size"] == 1201
+    # The choices made on the replaced questions are not counted on the new ones
+    stats = client.get('/questions/stats', headers=auth_headers).get_json()["questions"]
+    assert all(q["participations"] == 0 for q in stats)
+
+
+def test_bulk_import_is_atomic(client, auth_headers):
+    lines = [json.dumps(make_question(None)), '{"title": "Sans réponses"}']
+    response = client.post('/questions/import', data='\n'.join(lines), headers=auth_headers)
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Line 2:")
+    assert client.get('/quiz-info').get_json()["size"] == 0
+
+
+def test_participations_export(client, auth_headers, monkeypatch):
+    import bulk
+    monkeypatch.setattr(bulk, 'CHUNK_SIZE', 4)
+    add_questions(client, auth_headers, [1])
+    client.delete('/participations/all', headers=auth_headers)
+    for i in range(10):
+        client.post('/participations', json={"playerName": f"P{i}", "answers": [i % 2]})
+
+    response = client.get('/participations/export', headers=auth_headers)
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [r["playerName"] for r in records] == [f"P{i}" for i in range(10)]
+    assert sum(r["score"] for r in records) == 5
+
+    since = records[3]["createdAt"]
+    until = records[8]["createdAt"]
+    response = client.get(f'/participations/export?format=csv&since={since}&until={until}', headers=auth_headers)
+    rows = response.get_data(as_text=True).splitlines()
+    assert rows[0] == "id,playerName,score,createdAt"
+    assert [row.split(',')[1] for row in rows[1:]] == ["P3", "P4", "P5", "P6", "P7"]
+
+    assert client.get('/participations/export?since=hier', headers=auth_headers).status_code == 400
+
+
+def test_all_questions_pagination_and_projection(client, auth_headers):
+    add_questions(client, auth_headers, [1, 2, 3, 4, 1])
+
+    response = client.get('/questions/all?limit=2&fields=id,title', headers=auth_headers)
+    data = response.get_json()
+    assert [sorted(q) for q in data["questions"]] == [["id", "title"], ["id", "title"]]
+    assert data["nextCursor"] == 2
+    # Neither the image columns nor the answers are loaded
+    assert query_count(response) == 1
+
+    pages = [data["questions"]]
+    while data["nextCursor"] is not None:
+        data = client.get(f'/questions/all?limit=2&fields=title&after={data["nextCursor"]}',
+                          headers=auth_headers).get_json()
+        pages.append(data["questions"])
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert pages[-1][0]["title"] == "Question 5"
+
+    full = client.get('/questions/all?fields=image,possibleAnswers', headers=auth_headers).get_json()
+    assert full["questions"][0]["image"] == "falseb64imagecontent"
+    assert len(full["questions"][0]["possibleAnswers"]) == 4
+
+    assert client.get('/questions/all?fields=secret', headers=auth_headers).status_code == 400
+
+
+def test_quiz_bundle(client, auth_headers):
+    add_questions(client, auth_headers, [2, 3])
+
+    response = client.get('/quiz-bundle')
+    assert 'Content-Encoding' not in response.headers
+    bundle = response.get_json()
+    assert bundle["size"] == 2
+    assert [q["title"] for q in bundle["questions"]] == ["Question 1", "Question 2"]
+    assert bundle["questions"][0]["possibleAnswers"][1] == {"text": "Réponse 2"}
+    assert "isCorrect" not in json.dumps(bundle)
+
+    response = client.get('/quiz-bundle', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.data)) == bundle
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    # Served from memory until the quiz changes
+    cached = client.get('/quiz-bundle', headers={'Accept-Encoding': 'gzip'})
+    assert query_count(cached) == 0
+    not_modified = client.get('/quiz-bundle', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+    assert not_modified.status_code == 304
+
+    client.post('/questions', json=make_question(3), headers=auth_headers)
+    assert client.get('/quiz-bundle').get_json()["size"] == 3
+
+
+def test_question_json_cache(client, auth_headers):
+    ids = add_questions(client, auth_headers, [1, 2, 3])
+
+    first = client.get(f'/questions/{ids[1]}')
+    cached = client.get(f'/questions/{ids[1]}')
+    assert cached.get_json() == first.get_json()
+    assert query_count(cached) == 0
+
+    all_questions = client.get('/questions/all', headers=auth_headers)
+    assert [q["id"] for q in all_questions.get_json()["questions"]] == ids
+    assert query_count(client.get('/questions/all', headers=auth_headers)) == 0
+    assert query_count(client.get('/questions?position=3')) == 0
+
+    client.put(f'/questions/{ids[1]}', json=make_question(2, title="Modifiée"), headers=auth_headers)
+    assert client.get(f'/questions/{ids[1]}').get_json()["title"] == "Modifiée 2"
+    assert client.get('/questions/all', headers=auth_headers).get_json()["questions"][1]["title"] == "Modifiée 2"
+
+
+def test_jsonify_uses_orjson(client, auth_headers, monkeypatch):
+    import serialization
+    pytest.importorskip('orjson')
+    add_questions(client, auth_headers, [1])
+    calls = []
+    orjson_dumps = serialization.orjson.dumps
+
+    def counting_dumps(*args, **kwargs):
+        calls.append(args[0])
+        return orjson_dumps(*args, **kwargs)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("stdlib json used")
+    monkeypatch.setattr(serialization.orjson, 'dumps', counting_dumps)
+    monkeypatch.setattr(serialization.DefaultJSONProvider, 'dumps', fail)
+    response = client.get('/quiz-info')
+    assert response.get_json() == {"size": 1, "scores": []}
+    assert {"size": 1, "scores": []} in calls
+
+
+def test_json_provider_without_orjson(monkeypatch):
+    import serialization
+    from app import app
+    monkeypatch.setattr(serialization, 'orjson', None)
+    data = {"text": "Réponse", "values": [1, 2]}
+    assert json.loads(app.json.dumps(data)) == data
+    assert app.json.loads(app.json.dumps_bytes(data)) == data
+
+
+def login(client):
+    token = client.post('/login', json={'password': 'iloveflask'}).get_json()['token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_logout_revokes_token(client, auth_headers):
+    headers = login(client)
+    other_headers = login(client)
+    assert client.get('/questions/all', headers=headers).status_code == 200
+
+    assert client.post('/logout', headers=headers).status_code == 204
+    assert client.get('/questions/all', headers=headers).status_code == 401
+    assert client.get('/questions/all', headers=other_headers).status_code == 200
+
+    client.delete('/sessions/all', headers=other_headers)
+    assert client.get('/questions/all', headers=other_headers).status_code == 401
+    assert client.get('/questions/all', headers=login(client)).status_code == 200
+
+
+def test_revoked_token_survives_rebuild(client, auth_headers, monkeypatch):
+    import app as app_module
+    headers = login(client)
+    assert client.post('/logout', headers=headers).status_code == 204
+    assert client.post('/rebuild-db', headers=auth_headers).status_code == 200
+    # Revocations read again from the database, as every worker does
+    monkeypatch.setitem(app_module.app.config, 'CACHE_REVALIDATE_SECONDS', 0.001)
+    time.sleep(0.01)
+    assert client.get('/questions/all', headers=headers).status_code == 401
+    assert client.get('/questions/all', headers=auth_headers).status_code == 200
+
+
+@pytest.mark.parametrize("storage", ["disk", "memory"])
+def test_snapshot_restore(client, auth_headers, storage):
+    add_questions(client, auth_headers, [2, 4])
+    client.post('/participations', json={"playerName": "Anton", "answers": [2, 4]})
+    response = client.post('/snapshots/two-questions', json={"storage": storage}, headers=auth_headers)
+    assert response.status_code == 201
+    assert {"name": "two-questions", "storage": storage} in [
+        {"name": s["name"], "storage": s["storage"]}
+        for s in client.get('/snapshots', headers=auth_headers).get_json()["snapshots"]
+    ]
+    etag = client.get('/questions?position=1').headers['ETag']
+
+    client.post('/rebuild-db', headers=auth_headers)
+    add_questions(client, auth_headers, [1])
+    logged_out = login(client)
+    client.post('/logout', headers=logged_out)
+
+    response = client.post('/snapshots/two-questions/restore', headers=auth_headers)
+    assert response.status_code == 200
+    info = client.get('/quiz-info').get_json()
+    assert info["size"] == 2
+    assert [s["playerName"] for s in info["scores"]] == ["Anton"]
+    assert client.post('/participations', json={"answers": [2, 1]}).get_json()["rank"] == 2
+    # A new quiz version, and the sessions of the live database
+    assert client.get('/questions?position=1').headers['ETag'] != etag
+    assert client.get('/questions/all', headers=logged_out).status_code == 401
+    assert client.get('/questions/all', headers=auth_headers).status_code == 200
+
+    assert client.delete('/snapshots/two-questions', headers=auth_headers).status_code == 204
+    assert client.post('/snapshots/two-questions/restore', headers=auth_headers).status_code == 404
+    assert client.post('/snapshots/../quiz', headers=auth_headers).status_code in (400, 404)
+    assert client.post('/snapshots/x', json={"storage": "tape"}, headers=auth_headers).status_code == 400
+
+
+def test_expired_sessions_are_deleted(client, auth_headers):
+    import app as app_module
+    from datetime import datetime, timedelta
+    from models import AdminSession
+    with app_module.app.app_context():
+        db.session.add(AdminSession(token='expired', expires_at=datetime.utcnow() - timedelta(hours=1), revoked=True))
+        db.session.commit()
+        sessions = AdminSession.query.count()
+    login(client)
+    with app_module.app.app_context():
+        assert AdminSession.query.filter_by(token='expired').count() == 0
+        assert AdminSession.query.count() == sessions  # The new session replaces the expired one
+
+
+def test_verified_tokens_are_cached(client, auth_headers, monkeypatch):
+    import auth
+    assert client.get('/questions/all', headers={'Authorization': 'Bearer forged'}).status_code == 401
+    client.get('/questions/all', headers=auth_headers)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("token verified again")
+    monkeypatch.setattr(auth.jwt, 'decode', fail)
+    assert client.get('/questions/all', headers=auth_headers).status_code == 200
+
+
+def test_participations_rate_limited(client, auth_headers, monkeypatch):
+    import app as app_module
+    from ratelimit import TokenBucketLimiter
+    add_questions(client, auth_headers, [1])
+    monkeypatch.setitem(app_module.app.config, 'RATE_LIMITING', True)
+    monkeypatch.setitem(app_module.app.config, 'RATE_LIMIT_KEY_HEADER', 'X-Client-Id')
+    limiter = TokenBucketLimiter(rate=0.5, burst=2, max_clients=2)
+    monkeypatch.setitem(app_module.app.extensions['rate_limits'], 'participation', limiter)
+
+    statuses = [client.post('/participations', json={"answers": [1]}, headers={'X-Client-Id': 'a'}).status_code
+                for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    response = client.post('/participations', json={"answers": [1]}, headers={'X-Client-Id': 'a'})
+    assert int(response.headers['Retry-After']) >= 1
+    assert client.post('/participations', json={"answers": [1]}, headers={'X-Client-Id': 'b'}).status_code == 200
+
+    # Idle clients are evicted to bound memory
+    client.post('/participations', json={"answers": [1]}, headers={'X-Client-Id': 'c'})
+    assert len(limiter) == 2
+
+
+def test_clients_behind_a_proxy_do_not_share_a_bucket(client, auth_headers, monkeypatch):
+    import app as app_module
+    from ratelimit import TokenBucketLimiter
+    add_questions(client, auth_headers, [1])
+    monkeypatch.setitem(app_module.app.config, 'RATE_LIMITING', True)
+    limiter = TokenBucketLimiter(rate=0.5, burst=2)
+    monkeypatch.setitem(app_module.app.extensions['rate_limits'], 'participation', limiter)
+
+    # Every player comes from the proxy's address: only the concurrency cap applies
+    statuses = {client.post('/participations', json={"answers": [1]}).status_code for _ in range(5)}
+    assert statuses == {200}
+    assert len(limiter) == 0
+    # Unless clients are known to connect directly
+    monkeypatch.setitem(app_module.app.config, 'RATE_LIMIT_BY_IP', True)
+    statuses = [client.post('/participations', json={"answers": [1]}).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+
+def test_rate_limit_key_from_trusted_proxy(monkeypatch):
+    import app as app_module
+    from ratelimit import client_key
+    monkeypatch.setitem(app_module.app.config, 'RATE_LIMIT_KEY_HEADER', 'X-Forwarded-For')
+    forwarded = {'X-Forwarded-For': 'forged, 203.0.113.7, 10.0.0.2'}
+    with app_module.app.test_request_context(headers=forwarded):
+        assert client_key() == '10.0.0.2'
+    monkeypatch.setitem(app_module.app.config, 'RATE_LIMIT_TRUSTED_PROXIES', 2)
+    with app_module.app.test_request_context(headers=forwarded):
+        assert client_key() == '203.0.113.7'
+    monkeypatch.setitem(app_module.app.config, 'RATE_LIMIT_TRUSTED_PROXIES', 4)
+    with app_module.app.test_request_context(headers=forwarded, environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+        assert client_key() == '10.0.0.1'
+
+
+def test_admission_controller_fails_fast():
+    from ratelimit import AdmissionController
+    admission = AdmissionController(max_concurrent=1, max_wait=0.01)
+    assert admission.acquire()
+    assert not admission.acquire()
+    admission.release()
+    assert admission.acquire()
+
+
+def test_metrics_endpoint(client, auth_headers, monkeypatch):
+    import app as app_module
+    add_questions(client, auth_headers, [1])
+    client.get('/quiz-info')
+    client.get('/questions?position=1')
+
+    def broken_find_image(image_hash):
+        raise RuntimeError("disk unavailable")
+
+    monkeypatch.setattr(app_module, 'find_image', broken_find_image)
+    assert client.get('/images/' + 'a' * 64).status_code == 500
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    assert 'quiz_http_requests_total{route="/quiz-info",method="GET",status="200"}' in body
+    assert 'quiz_http_requests_total{route="/images/<image_hash>",method="GET",status="500"} 1' in body
+    assert 'quiz_http_request_duration_seconds_bucket{route="/quiz-info",method="GET",le="+Inf"}' in body
+    assert 'quiz_sql_statements_total{route="/questions"}' in body
+    assert ('quiz_unexpected_exceptions_total{route="/images/<image_hash>",exception="RuntimeError"} 1'
+            in body)
+    # Only the scrape itself is still running
+    assert 'quiz_http_requests_in_flight{route="/metrics"} 1' in body
+    assert 'quiz_http_requests_in_flight{route="/quiz-info"} 0' in body
+
+
+def test_caches_revalidate_changes_from_other_workers(client, auth_headers, monkeypatch):
+    import app as app_module
+    from datetime import datetime
+    from sqlalchemy import text
+    from auth import token_digest
+    from models import AdminSession
+    add_questions(client, auth_headers, [1])
+    client.post('/participations', json={"playerName": "Local", "answers": [1]})
+    etag = client.get('/quiz-info').headers['ETag']
+    assert client.get('/participations/rank?score=1').get_json()["participations"] == 1
+    monkeypatch.setitem(app_module.app.config, 'CACHE_REVALIDATE_SECONDS', 0.001)
+
+    # Writes made by another process, behind this worker's back
+    token = auth_headers['Authorization'].split(" ")[1]
+    with app_module.app.app_context():
+        db.session.execute(text("UPDATE quiz_state SET version = version + 1"))
+        db.session.add(Participation(player_name="Other worker", score=1, created_at=datetime.utcnow()))
+        # Logout
+        AdminSession.query.filter_by(token=token_digest(token)).update({AdminSession.revoked: True})
+        db.session.commit()
+    time.sleep(0.01)
+
+    response = client.get('/quiz-info')
+    assert response.headers['ETag'] != etag
+    assert response.get_json()["scores"][0]["playerName"] == "Other worker"
+    assert client.get('/participations/rank?score=1').get_json()["participations"] == 2
+    assert client.get('/questions/all', headers=auth_headers).status_code == 401
+
+
+def test_sqlite_connections_use_wal():
+    import app as app_module
+    from sqlalchemy import text
+    with app_module.app.app_context():
+        assert db.session.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+        assert db.session.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert db.session.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+
+
+# Schema of a database created by the first release
+BASELINE_SCHEMA = """
+CREATE TABLE question (id INTEGER NOT NULL, position INTEGER, title VARCHAR(200) NOT NULL, text TEXT NOT NULL,
+    image TEXT, created_at DATETIME, updated_at DATETIME, PRIMARY KEY (id), UNIQUE (position));
+CREATE TABLE answer (id INTEGER NOT NULL, question_id INTEGER NOT NULL, text VARCHAR(500) NOT NULL,
+    is_correct BOOLEAN NOT NULL, "order" INTEGER NOT NULL, PRIMARY KEY (id), FOREIGN KEY(question_id) REFERENCES question (id));
+CREATE TABLE participation (id INTEGER NOT NULL, player_name VARCHAR(100) NOT NULL, score INTEGER NOT NULL,
+    created_at DATETIME, PRIMARY KEY (id));
+CREATE TABLE admin_session (id INTEGER NOT NULL, token VARCHAR(200) NOT NULL, created_at DATETIME,
+    expires_at DATETIME NOT NULL, PRIMARY KEY (id), UNIQUE (token));
+INSERT INTO question (id, position, title, text, image) VALUES (1, 1, 'Ancienne', 'Texte', 'falseb64imagecontent');
+INSERT INTO answer (question_id, text, is_correct, "order") VALUES (1, 'Oui', 1, 1);
+INSERT INTO participation (player_name, score, created_at) VALUES ('Anton', 1, '2024-01-01 00:00:00');
+"""
+
+
+def test_existing_database_is_upgraded(tmp_path):
+    import sqlite3
+    from sqlalchemy import create_engine, inspect
+    path = tmp_path / 'baseline.db'
+    connection = sqlite3.connect(path)
+    connection.executescript(BASELINE_SCHEMA)
+    # Tables of later releases, without their last columns; the layout has a since deleted question
+    connection.executescript(
+        "CREATE TABLE quiz_layout (id INTEGER NOT NULL, question_ids TEXT NOT NULL, PRIMARY KEY (id), "
+        "UNIQUE (question_ids)); INSERT INTO quiz_layout (question_ids) VALUES ('1,7');"
+        "CREATE TABLE quiz_state (id INTEGER NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (id));"
+        "INSERT INTO quiz_state (id, version) VALUES (1, 5);"
+    )
+    connection.close()
+
+    engine = create_engine(f'sqlite:///{path}')
+    for _ in range(2):  # At every startup
+        db.metadata.create_all(engine)
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        assert columns == set(table.columns.keys()), table.name
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        assert {index.name for index in table.indexes} <= indexes, table.name
+    with engine.begin() as connection:
+        assert connection.exec_driver_sql('SELECT id, title, image, image_hash FROM question').all() == [
+            (1, 'Ancienne', 'falseb64imagecontent', None)
+        ]
+        connection.exec_driver_sql("INSERT INTO question (title, text) VALUES ('Nouvelle', 'Texte')")
+        assert connection.exec_driver_sql("SELECT id FROM question WHERE title = 'Nouvelle'").scalar() == 8
+        assert connection.exec_driver_sql('SELECT version, scores_version FROM quiz_state').all() == [(5, 0)]
+        # The search index follows the rebuilt table
+        matches = "SELECT rowid FROM question_search WHERE question_search MATCH 'nouvelle'"
+        assert connection.exec_driver_sql(matches).all() == [(8,)]
+    engine.dispose()
+
+
+def test_inline_images_are_moved_to_the_store(client, auth_headers):
+    import app as app_module
+    from sqlalchemy import text
+    from migrations import backfill_question_images
+    ids = add_questions(client, auth_headers, [1, 1, 1])
+    # Stored inline by the first release
+    with app_module.app.app_context():
+        db.session.execute(text("UPDATE question SET image = :image, image_hash = NULL WHERE id != :kept"),
+                           {"image": PNG_DATA_URL, "kept": ids[2]})
+        db.session.commit()
+        assert backfill_question_images(chunk_size=1) == 2
+        assert backfill_question_images() == 0  # At every startup
+
+    image_url = '/images/' + hashlib.sha256(PNG_BYTES).hexdigest()
+    assert client.get('/questions?position=1').get_json()["image"] == image_url
+    assert client.get(f'/questions/{ids[1]}').get_json()["image"] == image_url
+    assert client.get(image_url).data == PNG_BYTES
+    assert client.get(f'/questions/{ids[2]}').get_json()["image"] == "falseb64imagecontent"
+
+
+def test_question_ids_are_not_reused(client, auth_headers):
+    ids = add_questions(client, auth_headers, [1, 2])
+    client.delete(f'/questions/{ids[-1]}', headers=auth_headers)
+    new_id = add_questions(client, auth_headers, [1])[0]
+    assert new_id > ids[-1]
+
+
+def asgi_request(asgi_app, method, path, headers=None, body=b''):
+    """Drive an ASGI app with one request, returns (status, headers, body)"""
+    path, _, query_string = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+        'query_string': query_string.encode(), 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        await asgi_app(scope, receive, send)
+        start = messages[0]
+        response_headers = {name.decode(): value.decode() for name, value in start['headers']}
+        return start['status'], response_headers, b''.join(m.get('body', b'') for m in messages[1:])
+    return run()
+
+
+def test_async_read_path_matches_sync_app(client, auth_headers):
+    pytest.importorskip('aiosqlite')
+    pytest.importorskip('asgiref')
+    import asyncio
+    import app as app_module
+    from asgi import AsyncReadApp
+    from leaderboard import leaderboard
+    from quiz_state import commit_quiz_change
+    ids = add_questions(client, auth_headers, [1, 3])
+    client.post('/participations', json={"playerName": "Alice", "answers": [1, 3]})
+    asgi_app = AsyncReadApp(app_module.app)
+    paths = ['/quiz-info', '/questions?position=2', f'/questions/{ids[0]}', '/questions/999']
+
+    async def scenario():
+        # Cold caches: everything is read through aiosqlite
+        with app_module.app.app_context():
+            leaderboard.reset(empty=False)
+            commit_quiz_change()
+        cold = [await asgi_request(asgi_app, 'GET', path) for path in paths]
+        warm = [await asgi_request(asgi_app, 'GET', path) for path in paths]
+        revalidated = await asgi_request(asgi_app, 'GET', '/quiz-info',
+                                         {'If-None-Match': cold[0][1]['etag']})
+        # Anything else goes to the Flask app
+        delegated = await asgi_request(asgi_app, 'GET', '/questions/all',
+                                       {'Authorization': auth_headers['Authorization']})
+        await asgi_app.close()
+        return cold, warm, revalidated, delegated
+
+    cold, warm, revalidated, delegated = asyncio.run(scenario())
+    for path, cold_response, warm_response in zip(paths, cold, warm):
+        expected = client.get(path)
+        for status, headers, body in (cold_response, warm_response):
+            assert status == expected.status_code
+            assert body == expected.get_data()
+            assert headers.get('etag') == expected.headers.get('ETag')
+            assert headers['access-control-allow-origin'] == '*'
+    assert revalidated[0] == 304 and revalidated[2] == b''
+    assert delegated[0] == 200
+    assert delegated[2] == client.get('/questions/all', headers=auth_headers).get_data()
+
+
+def test_async_read_path_shares_concurrent_misses(client, auth_headers, monkeypatch):
+    pytest.importorskip('aiosqlite')
+    pytest.importorskip('asgiref')
+    import asyncio
+    import app as app_module
+    from asgi import AsyncReadApp
+    ids = add_questions(client, auth_headers, [1])
+    asgi_app = AsyncReadApp(app_module.app)
+    reads = []
+    read = asgi_app._read
+
+    async def counting_read(*queries):
+        reads.append(queries)
+        return await read(*queries)
+    monkeypatch.setattr(asgi_app, '_read', counting_read)
+
+    async def scenario():
+        responses = await asyncio.gather(*[
+            asgi_request(asgi_app, 'GET', f'/questions/{ids[0]}') for _ in range(20)
+        ])
+        await asgi_app.close()
+        return responses
+
+    responses = asyncio.run(scenario())
+    assert {status for status, _, _ in responses} == {200}
+    assert len({body for _, _, body in responses}) == 1
+    assert len(reads) == 1
+
+
+def test_apps_do_not_share_caches(client, auth_headers, tmp_path):
+    from app import create_app
+    add_questions(client, auth_headers, [1, 2])
+    client.post('/participations', json={"playerName": "Alice", "answers": [1, 2]})
+    assert len(client.get('/quiz-info').get_json()['scores']) == 1
+
+    other_app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'other.db'}",
+        'IMAGE_PROCESSING': False,
+        'TESTING': True
+    })
+    with other_app.app_context():
+        db.create_all()
+    other_client = other_app.test_client()
+    # The caches filled from the first database are not served from this one
+    info = other_client.get('/quiz-info').get_json()
+    assert info == {"size": 0, "scores": []}
+    assert other_client.get('/questions?position=1').status_code == 404
+    assert client.get('/questions?position=1').status_code == 200
@@ -1,52 +1,166 @@
-import base64
+import binascii
 import re
 from flask import current_app
 
-def validate_base64_image(base64_string):
+QUESTION_REQUIRED_FIELDS = ['title', 'text', 'position', 'possibleAnswers']
+
+# Signatures (offset, octets) des formats acceptés, lus dans les premiers octets décodés
+IMAGE_SIGNATURES = (
+    ('jpeg', ((0, b'\xff\xd8\xff'),)),
+    ('png', ((0, b'\x89PNG\r\n\x1a\n'),)),
+    ('gif', ((0, b'GIF87a'),)),
+    ('gif', ((0, b'GIF89a'),)),
+    ('webp', ((0, b'RIFF'), (8, b'WEBP'))),
+)
+SNIFF_BASE64_CHARS = 16  # 12 octets décodés, assez pour toutes les signatures
+DECODE_CHUNK_CHARS = 64 * 1024  # Multiple de 4
+
+def _split_data_url(base64_string):
+    """
+    Sépare l'en-tête d'une data URL de ses données sans copier les données
+    
+    Returns:
+        tuple: (header, data_start) où data_start est l'indice du premier
+            caractère base64, ou (None, None) si la virgule manque
+    """
+    comma = base64_string.find(',')
+    if comma < 0:
+        return None, None
+    return base64_string[:comma], comma + 1
+
+def decoded_base64_size(base64_string, start=0):
+    """
+    Taille décodée des données base64 à partir de `start`, calculée depuis
+    la longueur encodée et le remplissage, sans rien décoder
+    
+    Returns:
+        int: Taille en octets, ou None si la longueur n'est pas valide
+    """
+    length = len(base64_string) - start
+    if length % 4:
+        return None
+    padding = 0
+    if length and base64_string[-1] == '=':
+        padding = 2 if base64_string[-2] == '=' else 1
+    return length // 4 * 3 - padding
+
+def sniff_image_type(head):
     """
-    Valide une image encodée en base64
+    Retourne le format réel (jpeg, png, gif, webp) d'après les premiers
+    octets de l'image, ou None s'il n'est pas reconnu
+    """
+    for image_type, signature in IMAGE_SIGNATURES:
+        if all(head[offset:offset + len(magic)] == magic for offset, magic in signature):
+            return image_type
+    return None
+
+def decode_base64_chunked(base64_string, start, size):
+    """
+    Décode les données base64 par blocs dans un tampon de la taille finale,
+    sans copie intermédiaire de la chaîne complète
+    
+    Returns:
+        bytearray: Les octets décodés, ou None si les données sont invalides
+    """
+    image_data = bytearray(size)
+    view = memoryview(image_data)
+    position = 0
+    try:
+        for offset in range(start, len(base64_string), DECODE_CHUNK_CHARS):
+            chunk = binascii.a2b_base64(base64_string[offset:offset + DECODE_CHUNK_CHARS])
+            if position + len(chunk) > size:
+                return None
+            view[position:position + len(chunk)] = chunk
+            position += len(chunk)
+    except (binascii.Error, ValueError):
+        return None
+    # Les caractères hors alphabet sont ignorés par a2b_base64 : la taille le trahit
+    return image_data if position == size else None
+
+def decode_base64_image(base64_string, decode=True):
+    """
+    Valide et décode une image encodée en base64 (data URL)
+    
+    La taille est calculée sans décoder et le format est vérifié sur les
+    premiers octets ; les données ne sont décodées entièrement que si
+    `decode` est vrai, une fois tous les contrôles passés.
     
     Args:
         base64_string (str): L'image encodée en base64
+        decode (bool): Décoder l'image complète
         
     Returns:
-        tuple: (is_valid, error_message)
+        tuple: (image_data, image_type, error_message)
+            image_data vaut None si la valeur n'est pas une data URL d'image
+            (ou si decode est faux) ; image_type est le format réel du contenu
     """
     if not base64_string:
-        return True, None  # Image optionnelle
+        return None, None, None  # Image optionnelle
     
     try:
         if not base64_string.startswith('data:image/'):
-            return True, None
+            return None, None, None
         
-        # Extraire le type MIME et les données base64
-        header, data = base64_string.split(',', 1)
+        # Extraire le type MIME et repérer les données base64
+        header, start = _split_data_url(base64_string)
+        if header is None:
+            return None, None, "Données base64 invalides"
         
         # Vérifier le type MIME
         mime_match = re.match(r'data:image/(jpeg|jpg|png|gif|webp);base64', header)
         if not mime_match:
-            return False, "Type d'image non supporté. Formats acceptés: JPEG, PNG, GIF, WebP"
+            return None, None, "Type d'image non supporté. Formats acceptés: JPEG, PNG, GIF, WebP"
         
-        # Décoder les données base64
-        try:
-            image_data = base64.b64decode(data)
-        except Exception:
-            return False, "Données base64 invalides"
+        size = decoded_base64_size(base64_string, start)
+        if size is None:
+            # Données avec retours à la ligne ou espaces : cas rare, on les retire
+            base64_string, start = ''.join(base64_string[start:].split()), 0
+            size = decoded_base64_size(base64_string)
+            if size is None:
+                return None, None, "Données base64 invalides"
         
-        # Vérifier la taille
+        # Vérifier la taille avant de décoder quoi que ce soit
         max_size = current_app.config.get('MAX_IMAGE_SIZE_BYTES', 1024 * 1024)  # 1MB par défaut
-        if len(image_data) > max_size:
+        if size > max_size:
             max_size_mb = max_size / (1024 * 1024)
-            return False, f"L'image est trop volumineuse. Taille maximale autorisée: {max_size_mb:.1f}MB"
+            return None, None, f"L'image est trop volumineuse. Taille maximale autorisée: {max_size_mb:.1f}MB"
         
-        return True, None
+        # Vérifier le format réel sur les premiers octets, sans croire l'en-tête
+        try:
+            head = binascii.a2b_base64(base64_string[start:start + SNIFF_BASE64_CHARS])
+        except (binascii.Error, ValueError):
+            return None, None, "Données base64 invalides"
+        image_type = sniff_image_type(head)
+        if image_type is None:
+            return None, None, "Le contenu n'est pas une image JPEG, PNG, GIF ou WebP"
+        
+        if not decode:
+            return None, image_type, None
+        
+        image_data = decode_base64_chunked(base64_string, start, size)
+        if image_data is None:
+            return None, None, "Données base64 invalides"
+        return image_data, image_type, None
         
     except Exception as e:
-        return False, f"Erreur lors de la validation de l'image: {str(e)}"
+        return None, None, f"Erreur lors de la validation de l'image: {str(e)}"
+
+def validate_base64_image(base64_string):
+    """
+    Valide une image encodée en base64, sans la décoder entièrement
+    
+    Args:
+        base64_string (str): L'image encodée en base64
+        
+    Returns:
+        tuple: (is_valid, error_message)
+    """
+    _, _, error_message = decode_base64_image(base64_string, decode=False)
+    return error_message is None, error_message
 
 def get_image_size_bytes(base64_string):
     """
-    Retourne la taille en bytes d'une image base64
+    Retourne la taille en bytes d'une image base64, calculée sans la décoder
     
     Args:
         base64_string (str): L'image encodée en base64
@@ -57,9 +171,42 @@ def get_image_size_bytes(base64_string):
     if not base64_string or not base64_string.startswith('data:image/'):
         return 0
     
-    try:
-        _, data = base64_string.split(',', 1)
-        image_data = base64.b64decode(data)
-        return len(image_data)
-    except Exception:
-        return 0
\ No newline at end of file
+    header, start = _split_data_url(base64_string)
+    if header is None:
+        return 0
+    size = decoded_base64_size(base64_string, start)
+    if size is None:
+        size = decoded_base64_size(''.join(base64_string[start:].split()))
+    return size or 0
+
+def validate_question_data(data, require_position=True):
+    """
+    Valide les champs d'une question à créer (hors image)
+    
+    Args:
+        data (dict): La question reçue (title, text, position, possibleAnswers)
+        require_position (bool): Le champ position doit-il être présent
+        
+    Returns:
+        str: Message d'erreur, ou None si la question est valide
+    """
+    if not isinstance(data, dict):
+        return "Invalid question format"
+    
+    for field in QUESTION_REQUIRED_FIELDS:
+        if field == 'position' and not require_position:
+            continue
+        if field not in data:
+            return f"Missing required field: {field}"
+    
+    answers = data.get('possibleAnswers', [])
+    if not isinstance(answers, list) or len(answers) != 4:
+        return "Exactly 4 answers are required"
+    if not all(isinstance(a, dict) for a in answers):
+        return "Invalid answer format"
+    
+    correct_answers = [a for a in answers if a.get('isCorrect', False)]
+    if len(correct_answers) != 1:
+        return "Exactly one correct answer is required"
+    
+    return None
@@ -0,0 +1,136 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from images import write_file_atomically
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Optional, the original images are served instead of variants
+    Image = None
+
+# Variant name -> longest side in pixels
+VARIANTS = {'thumbnail': 160, 'display': 800}
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+logger = logging.getLogger(__name__)
+
+
+def _encodings(image):
+    """Yield (format, bytes) candidates for a resized image, without metadata"""
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    image.info.clear()  # No EXIF, ICC profile or text chunks in the output
+    candidates = [('WEBP', {'quality': 80, 'method': 4})]
+    if has_alpha:
+        candidates.append(('PNG', {'optimize': True}))
+    else:
+        candidates.append(('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}))
+    for image_format, options in candidates:
+        buffer = BytesIO()
+        try:
+            image.save(buffer, image_format, **options)
+        except (OSError, KeyError):
+            continue  # Pillow built without this encoder
+        yield image_format, buffer.getvalue()
+
+
+def process_image(source_path, store_path, image_hash):
+    """Write the variants of a stored image, keeping the smaller encoding.
+
+    Runs in a worker process. A variant is not written when it would be
+    no smaller than the original, which is then served instead.
+    Returns {variant: file name} of the written variants.
+    """
+    original_size = os.path.getsize(source_path)
+    written = {}
+    with Image.open(source_path) as original:
+        if getattr(original, 'is_animated', False):
+            return written  # Animations are served as uploaded
+        # Apply the EXIF orientation before the metadata is dropped
+        image = ImageOps.exif_transpose(original)
+        for variant, longest_side in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail((longest_side, longest_side))
+            encoded = min(_encodings(resized), key=lambda candidate: len(candidate[1]), default=None)
+            if encoded is None or len(encoded[1]) >= original_size:
+                continue
+            image_format, data = encoded
+            name = f'{image_hash}-{variant}.{FORMAT_EXTENSIONS[image_format]}'
+            write_file_atomically(os.path.join(store_path, name), data)
+            written[variant] = name
+    return written
+
+
+class ImageProcessor:
+    """Computes image variants in a pool of worker processes.
+
+    submit() only queues the job, so uploads never wait for it; until a
+    variant is written the original image is served in its place.
+    """
+
+    def __init__(self, store_path, max_workers=2):
+        self.store_path = store_path
+        self.max_workers = max_workers
+        self._executor = None
+        self._pending = {}  # image hash -> Future
+        self._lock = threading.Lock()
+        # Metrics
+        self.processed = 0
+        self.failed = 0
+
+    def _get_executor(self):
+        # Created on first use, so after gunicorn has forked the worker; the
+        # pool processes are spawned rather than forked from a threaded process
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def submit(self, image_hash, source_path):
+        """Queue the processing of a stored image, returns its Future"""
+        with self._lock:
+            future = self._pending.get(image_hash)
+            if future is not None:
+                return future
+            future = self._get_executor().submit(process_image, source_path, self.store_path, image_hash)
+            self._pending[image_hash] = future
+        future.add_done_callback(lambda f: self._done(image_hash, f))
+        return future
+
+    def _done(self, image_hash, future):
+        with self._lock:
+            self._pending.pop(image_hash, None)
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.processed += 1
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Processing of image %s failed: %s", image_hash, future.exception())
+
+    def stats(self):
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "pending": len(self._pending)
+        }
+
+    def stop(self):
+        """Finish the queued jobs and stop the worker processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def init_image_processor(app):
+    """Create the app's image processor, unless disabled or Pillow is missing"""
+    app.extensions['image_processor'] = None
+    if app.config['IMAGE_PROCESSING'] and Image is not None:
+        image_processor = ImageProcessor(app.config['IMAGE_STORE_PATH'], app.config['IMAGE_PROCESSING_WORKERS'])
+        app.extensions['image_processor'] = image_processor
+        atexit.register(image_processor.stop)
@@ -1,7 +1,9 @@
 import axios from 'axios'
 
+const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:5000'
+
 const instance = axios.create({
-  baseURL: import.meta.env.VITE_API_URL || 'http://localhost:5000',
+  baseURL: API_BASE_URL,
   json: true,
   timeout: 10000 // 10 secondes timeout
 })
@@ -111,6 +113,14 @@ export default {
     return new Promise(resolve => setTimeout(resolve, ms))
   },
 
+  // Images are served by the API under /images/<hash>
+  resolveImageUrl(src) {
+    if (typeof src === 'string' && src.startsWith('/images/')) {
+      return API_BASE_URL.replace(/\/$/, '') + src
+    }
+    return src
+  },
+
   // Public endpoints
   getQuizInfo() {
     return this.call('get', '/quiz-info')
@@ -120,8 +130,14 @@ export default {
     return this.call('get', `/questions/${id}`)
   },
 
+  // Images en taille d'affichage (version réduite calculée par l'API)
   getQuestionByPosition(position) {
-    return this.call('get', `/questions?position=${position}`)
+    return this.call('get', `/questions?position=${position}&size=display`)
+  },
+
+  // Tout le quiz jouable en une seule requête (sans les bonnes réponses)
+  getQuizBundle() {
+    return this.call('get', '/quiz-bundle')
   },
 
   submitParticipation(playerName, answers) {
@@ -137,8 +153,10 @@ export default {
   },
 
   // Admin endpoints (require token)
-  getAllQuestions(token) {
-    return this.call('get', '/questions/all', null, token)
+  // params: { limit, after, fields } pour paginer / ne charger que certains champs
+  getAllQuestions(token, params = null) {
+    const query = params ? '?' + new URLSearchParams(params).toString() : ''
+    return this.call('get', `/questions/all${query}`, null, token)
   },
 
   createQuestion(questionData, token) {
@@ -82,7 +82,7 @@ describe('QuizApiService', () => {
         headers: {
           'Content-Type': 'application/json'
         },
-        url: '/questions?position=1',
+        url: '/questions?position=1&size=display',
         data: null
       })
       expect(result).toEqual(mockResponse)